@@ -180,10 +180,10 @@ def main():
         utils.print_usage()
         return 0
 
-    # Ensure we have a trailing slash on the mlhub.
+    # Ensure we have a trailing slash on each mlhub.
 
     if args.mlhub is not None:
-        constants.MLHUB = os.path.join(args.mlhub, "")
+        constants.MLHUB = utils.get_repo(args.mlhub)
 
     if args.mlmetavar is not None:
         constants.CMD = args.mlmetavar
@@ -241,6 +241,12 @@ def main():
         msg = "URL - '{}' failed:\n  {}".format(e.args[0], e.args[1])
         utils.print_error_exit(msg)
 
+    except utils.DownloadChecksumException as e:
+        msg = "URL - '{}' downloaded a corrupt or different file:\n  expected {}\n  got      {}"
+        expected = ', '.join('{} {}'.format(k, v) for k, v in sorted(e.args[1].items()))
+        actual = ', '.join('{} {}'.format(k, e.args[2][k]) for k in sorted(e.args[1]))
+        utils.print_error_exit(msg.format(e.args[0], expected, actual))
+
     except utils.DescriptionYAMLNotFoundException as e:
         msg = "No MLHUB description file found: {}"
 
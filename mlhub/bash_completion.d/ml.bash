@@ -74,6 +74,7 @@ _mlhub() {
     local global_options    # list of available global options 
 
     local available_options
+    local search_options
     local clean_options
     local installed_options
     local commands_options
@@ -91,6 +92,7 @@ _mlhub() {
     # available global commands
     global_commands="\
     	available\
+	search\
 	clean\
         installed\
 	commands\
@@ -117,6 +119,11 @@ _mlhub() {
         --name-only\
 	"
 
+    search_options="\
+	-h --help\
+        --name-only\
+	"
+
     clean_options="\
 	-h --help\
 	"
@@ -153,6 +160,9 @@ _mlhub() {
 	available)
 	    complete_options="${available_options}"
             ;;
+	search)
+	    complete_options="${search_options}"
+	    ;;
 	clean)
 	    complete_options="${clean_options}"
 	    ;;
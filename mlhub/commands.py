@@ -30,7 +30,6 @@
 
 import distro
 import glob
-import json
 import logging
 import mlhub.utils as utils
 import os
@@ -41,7 +40,6 @@ import subprocess
 import sys
 import tempfile
 import textwrap
-import urllib.request
 import yaml
 
 from distutils.version import StrictVersion
@@ -71,29 +69,34 @@ def list_available(args):
     logger.info('List available models.')
     logger.debug('args: {}'.format(args))
 
-    meta, repo = utils.get_repo_meta_data(args.mlhub)
-    model_names = [entry["meta"]["name"] for entry in meta]
+    # Entries are listed while the repo index is being read.
 
-    # Update bash completion list.
-
-    utils.update_model_completion(set(model_names))
-
-    # List model name only.
-
-    if args.name_only:
-        print('\n'.join(model_names))
-        return
+    repo = utils.get_repo(args.mlhub)
+    meta = utils.iter_repo_meta_data(repo)
+    model_names = []
 
     # Provide some context.
 
-    if not args.quiet:
+    if not args.name_only and not args.quiet:
         msg = "The repository '{}' provides the following models:\n"
         print(msg.format(repo))
 
-    # List the meta data.
-
     for entry in meta:
-        utils.print_meta_line(entry)
+        model_names.append(entry["meta"]["name"])
+
+        # List model name only, otherwise the meta data.
+
+        if args.name_only:
+            print(model_names[-1], flush=True)
+        else:
+            utils.print_meta_line(entry)
+
+    # Update bash completion list.
+
+    utils.update_model_completion(set(model_names))
+
+    if args.name_only:
+        return
 
     # Suggest next step.
     
@@ -104,6 +107,49 @@ def list_available(args):
                   "  $ ml install rain\n")
 
 
+# ------------------------------------------------------------------------
+# SEARCH
+# ------------------------------------------------------------------------
+
+def search_available(args):
+    """List the models in the Hub matching the search terms, the best first."""
+
+    # Setup.
+
+    logger = logging.getLogger(__name__)
+    logger.info('Search available models.')
+    logger.debug('args: {}'.format(args))
+
+    repo = utils.get_repo(args.mlhub)
+    meta = utils.search_repo(repo, args.term)
+
+    # Provide some context.
+
+    if not args.name_only and not args.quiet:
+        if len(meta) == 0:
+            msg = "The repository '{}' provides no models matching '{}'.\n"
+        else:
+            msg = "The repository '{}' provides the following models matching '{}':\n"
+        print(msg.format(repo, ' '.join(args.term)))
+
+    for entry in meta:
+
+        # List model name only, otherwise the meta data.
+
+        if args.name_only:
+            print(entry["meta"]["name"])
+        else:
+            utils.print_meta_line(entry)
+
+    if args.name_only:
+        return
+
+    # Suggest next step.
+
+    if not args.quiet and len(meta) != 0:
+        utils.print_next_step('search')
+
+
 # ------------------------------------------------------------------------
 # INSTALLED
 # ------------------------------------------------------------------------
@@ -200,9 +246,12 @@ def install_model(args):
     logger.info('Install a model.')
     logger.debug('args: {}'.format(args))
 
+    http_stats = utils.get_http_stats()  # To report the HTTP requests of the installation
+
     model = args.model   # model pkg name
     location = args.model     # pkg file path or URL
     version = None       # model pkg version
+    checksum = None      # expected sha256 and/or size of the pkg file
     mlhubyaml = None     # MLHUB.yaml path or URL
 
     # Obtain the model URL if not a local file.
@@ -224,7 +273,7 @@ def install_model(args):
 
         # Get model pkg meta data from mlhub repo.
 
-        location, version, meta_list = utils.get_model_info_from_repo(model, args.mlhub)
+        location, version, checksum, meta_list = utils.get_model_info_from_repo(model, args.mlhub)
 
         # Update bash completion list.
 
@@ -249,7 +298,10 @@ def install_model(args):
     if utils.is_archive(location):
         pkgfile = os.path.basename(location)  # pkg file name
     elif utils.is_url(location):
-        pkgfile = utils.get_url_filename(location)
+        record = None  # Record of the GitHub commit archive downloaded before, whose name is known
+        if utils.is_github_commit_archive(location):
+            record = utils.read_store_url(location)
+        pkgfile = utils.get_url_filename(location) if record is None else record['filename']
 
     # Query archive type if not available from file name per se.
 
@@ -263,7 +315,7 @@ def install_model(args):
     # Installation.
 
     entry = None     # Meta info read from MLHUB.yaml
-    with tempfile.TemporaryDirectory() as mlhubtmpdir:
+    with tempfile.TemporaryDirectory(dir=utils.create_tmp_dir()) as mlhubtmpdir:  # Same file system as packages
 
         # Determine the local path of the model package
 
@@ -284,7 +336,7 @@ def install_model(args):
             elif not utils.is_github_url(location):  # Get MLHUB.yaml inside the archive file.
 
                 if utils.is_url(location):  # Download the package file because it is not from GitHub.
-                    utils.download_model_pkg(location, local, pkgfile, args.quiet)
+                    utils.download_model_pkg(location, local, pkgfile, args.quiet, checksum=checksum)
 
                 if not args.quiet:
                     print("Extracting '{}' ...\n".format(pkgfile))
@@ -329,18 +381,28 @@ def install_model(args):
             else:
                 print()
 
-            shutil.rmtree(install_path)
+        # Build the package in a new version dir, replacing the installed version, if any,
+        # only once complete, so that the package is never broken for commands running
+        # at the same time, nor if installation fails.
+
+        version_dir = utils.get_new_package_version_dir(model)
 
         # Uncompress package file.
 
         if not os.path.exists(uncompressdir):  # Model pkg mlm or GitHub pkg has not unzipped yet.
             if utils.is_url(location):  # Download the package file if needed.
-                utils.download_model_pkg(location, local, pkgfile, args.quiet)
+                utils.download_model_pkg(location, local, pkgfile, args.quiet, checksum=checksum)
 
             if not args.quiet:
                 print("Extracting '{}' ...\n".format(pkgfile))
 
-            utils.unpack_with_promote(local, uncompressdir, valid_name=pkgfile)
+            # Only extract the package files specified in MLHUB.yaml if it is read already.
+
+            select = None
+            if entry is not None and utils.get_file_spec(entry) is not None:
+                select = utils.select_package_files(utils.flatten_mlhubyaml_deps(utils.get_file_spec(entry))[0][1])
+
+            utils.unpack_with_promote(local, uncompressdir, valid_name=pkgfile, select=select)
 
         # Install package files.
         #
@@ -354,53 +416,45 @@ def install_model(args):
             mlhubyaml = utils.get_available_pkgyaml(uncompressdir)
             entry = utils.read_mlhubyaml(mlhubyaml)
 
-        depspec = None
-        if 'dependencies' in entry:
-            depspec = entry['dependencies']
-        elif 'dependencies' in entry['meta']:
-            depspec = entry['meta']['dependencies']
-
-        file_spec = None
-        if depspec is not None and 'files' in depspec:
-            file_spec = {'files': depspec['files']}
-        elif 'files' in entry:
-            file_spec = {'files': entry['files']}
-
-        if file_spec is not None:  # install package files if they are specified in MLHUB.yaml
+        file_spec = utils.get_file_spec(entry)
+        try:
+            if file_spec is not None:  # install package files if they are specified in MLHUB.yaml
 
-            # MLHUB.yaml should always be at the package root.
+                # MLHUB.yaml should always be at the package root.
 
-            os.mkdir(install_path)
-            if utils.is_url(mlhubyaml):  # We currently only support MLHUB.yaml specified on GitHub.
-                if mlhubyaml.startswith("https://api"):
-                    urllib.request.urlretrieve(
-                        json.loads(urllib.request.urlopen(mlhubyaml).read())['download_url'],
-                        os.path.join(install_path, MLHUB_YAML))
+                os.mkdir(version_dir)
+                if utils.is_url(mlhubyaml):  # We currently only support MLHUB.yaml specified on GitHub.
+                    with open(os.path.join(version_dir, MLHUB_YAML), 'wb') as file:
+                        file.write(utils.read_github_raw_file(mlhubyaml))
                 else:
-                    urllib.request.urlretrieve(
-                        mlhubyaml,
-                        os.path.join(install_path, MLHUB_YAML))
-            else:
-                shutil.move(mlhubyaml, install_path)
+                    utils.move_file_or_dir(mlhubyaml, version_dir)
 
-            # All package files except MLHUB.yaml should be specified in 'files' of MLHUB.yaml
+                # All package files except MLHUB.yaml should be specified in 'files' of MLHUB.yaml
 
-            try:
                 utils.install_file_deps(utils.flatten_mlhubyaml_deps(file_spec)[0][1],
                                         model,
                                         downloadir=uncompressdir,
-                                        yes=True)
-            except utils.ModePkgInstallationFileNotFoundException as e:
-                if os.path.exists(install_path):
-                    shutil.rmtree(install_path)
+                                        yes=True,
+                                        pkg_dir=version_dir)
 
-                raise
+            else:
+                # Otherwise, put all files under package dir.
+                # **Note** Here we must make sure <version_dir> does not exist.
+                # Otherwise, <unzipdir> will be inside <version_dir>
+                utils.move_file_or_dir(uncompressdir, version_dir)
 
-        else:
-            # Otherwise, put all files under package dir.
-            # **Note** Here we must make sure <instal_path> does not exist.
-            # Otherwise, <unzipdir> will be inside <install_path>
-            shutil.move(uncompressdir, install_path)
+        except BaseException:
+            utils.remove_file_or_dir(version_dir)  # The installed version, if any, is kept.
+            raise
+
+        # Swap the new version in, which once done is never undone.
+
+        try:
+            utils.install_package_version(model, version_dir)
+        except BaseException:
+            if os.path.realpath(install_path) != os.path.realpath(version_dir):  # Not swapped in
+                utils.remove_file_or_dir(version_dir)
+            raise
 
         # Update bash completion list.
 
@@ -411,6 +465,10 @@ def install_model(args):
         if args.workding_dir is not None:
             utils.update_working_dir(model, args.workding_dir)
 
+        stats = utils.get_http_stats()
+        logger.debug("Installation of '{}' sent {} HTTP requests, {} more answered from the response cache.".format(
+            model, stats['requests'] - http_stats['requests'], stats['cached'] - http_stats['cached']))
+
         if not args.quiet:
 
             # Informative message about the size of the installed model.
@@ -737,7 +795,7 @@ def configure_model(args):
             msg = ("No configuration script provided for this model. "
                    "The following dependencies are required:\n")
             print(msg)
-            print(yaml.dump(depspec))
+            print(yaml.dump(depspec, Dumper=utils.OrderedYAMLDumper, default_flow_style=False))
         else:
             print("No configuration provided (maybe none is required).")
 
@@ -948,6 +1006,18 @@ def remove_mlm(args):
         if utils.yes_or_no("Remove model package archive '{}'", m, yes=True):
             os.remove(m)
 
+    # Remove the downloaded files no longer used by any model package.
+
+    removed = utils.clean_download_store()
+    if removed != 0 and not args.quiet:
+        print("Removed {} unused files from the download store.".format(removed))
+
+    # Remove what is left by interrupted installations.
+
+    removed = utils.clean_tmp_dir()
+    if removed != 0 and not args.quiet:
+        print("Removed {} files left by interrupted installations.".format(removed))
+
 
 # ------------------------------------------------------------------------
 # REMOVE
@@ -993,7 +1063,10 @@ def remove_model(args):
 
         # Remove package installation dir
 
-        shutil.rmtree(path)
+        if model is None:
+            shutil.rmtree(path)
+        else:
+            utils.remove_package_dir(model)
 
         # Remove package config dir as well without ask
 
@@ -34,13 +34,14 @@ import os
 
 # ------------------------------------------------------------------------
 # The default ML Hub can be overriden by an environment variable or by
-# the command line option --mlhub.
+# the command line option --mlhub.  Several ML Hubs can be separated by
+# commas, in order of precedence.
 # ------------------------------------------------------------------------
 
 MLHUB = "https://mlhub.ai/"
 if "MLHUB" in os.environ:
-    # The following adds a trainling "/" as assumed in the code.
-    MLHUB = os.path.join(os.getenv("MLHUB"), "")
+    # The following adds a trainling "/" to each hub as assumed in the code.
+    MLHUB = ','.join(os.path.join(x.strip(), "") for x in os.getenv("MLHUB").split(',') if x.strip() != '')
 
 HUB_PATH = "pool/main/"
 
@@ -73,6 +74,102 @@ ARCHIVE_DIR = os.path.join(MLINIT, ".archive")
 CONFIG_DIR = os.path.join(MLINIT, ".config")
 CONFIG_FILE = "config.yaml"
 
+# Files downloaded for model packages, stored by their sha256 and shared by
+# the packages, which link to them from their cache and archive dirs.
+
+STORE_DIR = os.path.join(MLINIT, ".store")
+
+# Scratch dir where packages are staged before installed, on the same file
+# system as the packages so that they are moved into place by renaming.
+
+TMP_DIR = os.path.join(MLINIT, ".tmp")
+
+# Installed versions of the packages.  The package dir is a symbolic link to
+# the version installed, replaced atomically by a new version.  A replaced
+# version is kept for commands still running in it, and only removed once
+# replaced again, or by ml clean, after VERSIONS_GRACE seconds.
+
+VERSIONS_DIR = os.path.join(MLINIT, ".versions")
+VERSIONS_GRACE = 24 * 3600
+
+# Cached copy of the ML Hub repository index (Packages.yaml).  A cached index
+# younger than REPO_CACHE_TTL seconds is used without asking the repository,
+# which can be overriden by the environment variable MLHUB_REPO_TTL.
+
+REPO_CACHE_DIR = os.path.join(MLINIT, ".repo")
+REPO_CACHE_STATE = "state.json"
+REPO_CACHE_INDEX = "index.pickle"  # Compiled from the cached Packages.yaml.
+REPO_CACHE_SEARCH = "search.pickle"  # Inverted index of the compiled index.
+
+# Cached responses of the GitHub contents API.  They are revalidated by
+# conditional requests, which do not count against the API rate limit, except
+# those for a commit which never change.  Requests to the API are authenticated
+# by the token in the environment variable GITHUB_TOKEN if set, for a higher
+# rate limit.
+
+GITHUB_CACHE_DIR = os.path.join(MLINIT, ".github")
+
+GITHUB_TOKEN = None
+if "GITHUB_TOKEN" in os.environ:
+    GITHUB_TOKEN = os.getenv("GITHUB_TOKEN")
+
+# Meta data of each model kept in the compiled repository index, which are
+# those needed by `ml available`, `ml search` and `ml install`.  The names
+# of the commands of each model are kept as well.
+
+REPO_INDEX_FIELDS = ('name', 'version', 'title', 'description', 'keywords', 'yaml', 'url', 'sha256', 'size')
+
+# Weights of the meta data searched by `ml search`.
+
+REPO_SEARCH_WEIGHTS = collections.OrderedDict([
+    ('name', 8),
+    ('title', 4),
+    ('keywords', 4),
+    ('commands', 2),
+    ('description', 1),
+])
+
+REPO_CACHE_TTL = 3600
+if "MLHUB_REPO_TTL" in os.environ:
+    REPO_CACHE_TTL = int(os.getenv("MLHUB_REPO_TTL"))
+
+# Connections kept alive per host by the HTTP client shared by all network
+# calls, times a request is retried on connection errors or 429/5xx
+# responses, and seconds to wait for a server.
+
+HTTP_POOL_SIZE = 32
+HTTP_RETRIES = 3
+HTTP_TIMEOUT = 60
+
+# Number of files downloaded at the same time, overall and from the same host.
+
+DOWNLOAD_WORKERS = 8
+if "MLHUB_DOWNLOAD_WORKERS" in os.environ:
+    DOWNLOAD_WORKERS = int(os.getenv("MLHUB_DOWNLOAD_WORKERS"))
+
+DOWNLOAD_HOST_WORKERS = 4
+if "MLHUB_DOWNLOAD_HOST_WORKERS" in os.environ:
+    DOWNLOAD_HOST_WORKERS = int(os.getenv("MLHUB_DOWNLOAD_HOST_WORKERS"))
+
+# Number of times a dropped download is resumed before giving up.
+
+DOWNLOAD_RETRIES = 5
+
+# Maximum number of segments a large file is split into and downloaded
+# concurrently if the server accepts byte ranges, and minimum size of a segment.
+
+DOWNLOAD_SEGMENTS = 4
+if "MLHUB_DOWNLOAD_SEGMENTS" in os.environ:
+    DOWNLOAD_SEGMENTS = int(os.getenv("MLHUB_DOWNLOAD_SEGMENTS"))
+
+DOWNLOAD_SEGMENT_SIZE = 8 * 1024 * 1024
+
+# Number of members of a zip file extracted at the same time.
+
+EXTRACT_WORKERS = min(32, os.cpu_count() or 1)
+if "MLHUB_EXTRACT_WORKERS" in os.environ:
+    EXTRACT_WORKERS = int(os.getenv("MLHUB_EXTRACT_WORKERS"))
+
 # ------------------------------------------------------------------------
 # Application information.
 # ------------------------------------------------------------------------
@@ -83,6 +180,7 @@ CMD = "ml"                 # The command line tool.
 
 EXT_MLM = ".mlm"    # Archive filename extension
 EXT_AIPK = ".aipk"  # Backward compatibility
+EXT_PART = ".part"  # Partially downloaded file
 
 VERSION = "3.4.8"  # DO NOT MODIFY. Managed from ../Makefile.
 
@@ -109,7 +207,7 @@ OPTIONS = {
     '--init-dir':
         {'help': "use this as the init dir instead of '{}'.".format(MLINIT)},
     '--mlhub':
-        {'help': "use this ML Hub instead of '{}'.".format(MLHUB)},
+        {'help': "use this ML Hub, or comma separated ML Hubs, instead of '{}'.".format(MLHUB)},
     '--cmd':
         {'help': "command display name instead of '{}'.".format(CMD),
          'dest': 'mlmetavar',
@@ -151,6 +249,18 @@ COMMANDS = {
                 'next': ['install'],
         },
 
+    'search':
+        {'description': "search the models available from the ML Hub repository",
+            'argument': {'term': {'nargs': "+"},
+                         '--name-only': {'help': "list only the names",
+                                         'action': "store_true"},
+                        },
+               'usage': "  search     <term>    "
+                        "search the models available from the ML Hub repository",
+                'func': "search_available",
+                'next': ['install'],
+        },
+
     'installed':
         {'description': "list the locally installed models",
             'argument': {'--name-only': {'help': "list only the names",
@@ -300,8 +410,8 @@ The user can then run the following for tab completion:
 List the available models from the repository with:
 
   $ ml available
-""".format('\n'.join(list(COMMANDS_USAGE.values())[:3]),
-           '\n'.join(list(COMMANDS_USAGE.values())[3:]))
+""".format('\n'.join(list(COMMANDS_USAGE.values())[:4]),
+           '\n'.join(list(COMMANDS_USAGE.values())[4:]))
 
 # ------------------------------------------------------------------------
 # Filenames
@@ -317,6 +427,13 @@ META_YAML = "Packages.yaml"
 DESC_YML = "DESCRIPTION.yml"
 META_YML = "Packages.yml"
 
+# Each entry of Packages.yaml is also available as index/<name>.yaml and
+# index/MANIFEST.yaml lists the sha256 of each entry, in the same order as
+# in Packages.yaml, so that only changed entries need to be downloaded.
+
+META_INDEX_DIR = "index"
+META_MANIFEST = "MANIFEST.yaml"
+
 # ------------------------------------------------------------------------
 # Debugging
 # ------------------------------------------------------------------------
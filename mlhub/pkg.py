@@ -29,12 +29,14 @@
 # THE SOFTWARE.
 
 import json
+import mlhub.utils as utils
 import os
 import sys
-import requests
 import termios
 import tty
 
+from mlhub.constants import HTTP_TIMEOUT
+
 # ----------------------------------------------------------------------
 # Support Package Developers
 # ----------------------------------------------------------------------
@@ -178,9 +180,10 @@ def azrequest(endpoint, url, subscription_key, request_data):
     headers = {'Content-Type': 'application/json',
                'Ocp-Apim-Subscription-Key': subscription_key}
     
-    response = requests.post(os.path.join(endpoint, url),
-                             data=json.dumps(request_data),
-                             headers=headers)
+    response = utils.get_http_session().post(os.path.join(endpoint, url),
+                                             data=json.dumps(request_data),
+                                             headers=headers,
+                                             timeout=HTTP_TIMEOUT)
     
     if response.status_code == 200:
         return json.loads(response.content.decode("utf-8"))
@@ -29,23 +29,36 @@
 # THE SOFTWARE.
 
 import base64
+import bisect
 import cgi
 import collections
+import concurrent.futures
+import copy
 import distro
+import hashlib
+import http.client
+import io
 import json
 import logging
 import os
+import pickle
+import posixpath
 import re
+import requests
+import requests.adapters
 import shutil
 import subprocess
 import sys
 import tarfile
 import tempfile
+import threading
+import time
 import urllib.error
+import urllib.parse
 import urllib.request
+import urllib3
 import uuid
 import yaml
-import yamlordereddictloader
 import zipfile
 
 from fuzzywuzzy import fuzz
@@ -66,9 +79,23 @@ from mlhub.constants import (
     CONFIG_FILE,
     DESC_YAML,
     DESC_YML,
+    DOWNLOAD_HOST_WORKERS,
+    DOWNLOAD_RETRIES,
+    DOWNLOAD_SEGMENT_SIZE,
+    DOWNLOAD_SEGMENTS,
+    DOWNLOAD_WORKERS,
     EXT_AIPK,
     EXT_MLM,
+    EXT_PART,
+    EXTRACT_WORKERS,
+    GITHUB_CACHE_DIR,
+    GITHUB_TOKEN,
+    HTTP_POOL_SIZE,
+    HTTP_RETRIES,
+    HTTP_TIMEOUT,
     LOG_DIR,
+    META_INDEX_DIR,
+    META_MANIFEST,
     META_YAML,
     META_YML,
     MLHUB,
@@ -76,336 +103,2191 @@ from mlhub.constants import (
     MLINIT,
     PIP_PATH,
     PYTHON_PATH,
+    REPO_CACHE_DIR,
+    REPO_CACHE_INDEX,
+    REPO_CACHE_SEARCH,
+    REPO_CACHE_STATE,
+    REPO_CACHE_TTL,
+    REPO_INDEX_FIELDS,
+    REPO_SEARCH_WEIGHTS,
     RSCRIPT_CMD,
+    STORE_DIR,
+    TMP_DIR,
     SYS_PYTHON_PKG_USAGE,
     USAGE,
     VERSION,
+    VERSIONS_DIR,
+    VERSIONS_GRACE,
     WORKING_DIR,
 )
 
 
+# ----------------------------------------------------------------------
+# HTTP
+# ----------------------------------------------------------------------
+
+_http_session = None
+_http_session_lock = threading.Lock()
+
+# Responses read during this invocation of ml, keyed by the method, URL and
+# headers of the request, and the number of requests sent and answered from
+# them.
+
+_http_cache = {}
+_http_stats = collections.Counter()
+_http_cache_lock = threading.Lock()
+
+
+def get_http_session():
+    """Return the HTTP session shared by all network calls.
+
+    Connections are kept alive and pooled per host, thus reused by the
+    requests to the same host, and requests are retried with backoff on
+    connection errors and 429/5xx responses.
+    """
+
+    global _http_session
+
+    with _http_session_lock:
+        if _http_session is None:
+            retry = urllib3.util.Retry(
+                total=HTTP_RETRIES,
+                backoff_factor=0.5,
+                status_forcelist=(429, 500, 502, 503, 504),
+                raise_on_status=False)
+            adapter = requests.adapters.HTTPAdapter(
+                pool_connections=HTTP_POOL_SIZE,
+                pool_maxsize=HTTP_POOL_SIZE,
+                max_retries=retry)
+
+            session = requests.Session()
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            session.headers['Accept-Encoding'] = 'identity'  # Byte ranges and sizes refer to the file.
+            session.headers['User-Agent'] = '{}/{}'.format(APP, VERSION)
+            _http_session = session
+
+    return _http_session
+
+
+class HTTPResponse(object):
+    """Response to a request by open_url, with the interface of http.client.HTTPResponse.
+
+    The body is streamed from the connection, which is returned to the
+    pool once the body is read or the response closed.
+    """
+
+    def __init__(self, response):
+        self.response = response
+        self.url = response.url
+        self.status = response.status_code
+        self.reason = response.reason
+        self.headers = response.headers
+
+    def getheader(self, name, default=None):
+        return self.headers.get(name, default)
+
+    def read(self, amt=None):
+        """Read the body, or up to <amt> bytes of it which may be fewer, an empty result at its end."""
+
+        raw = self.response.raw
+        try:
+            if amt is None or not hasattr(raw, 'read1'):
+                return raw.read(amt, decode_content=True)
+
+            # Return the bytes received so far rather than losing them if the connection drops.
+
+            return raw.read1(amt, decode_content=True)
+        except (requests.exceptions.RequestException, urllib3.exceptions.HTTPError) as error:
+            raise http.client.HTTPException(error)  # The connection dropped.
+
+    def close(self):
+        self.response.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class URLResponse(HTTPResponse):
+    """Response to a request by open_url of a URL other than HTTP, like a file:// one."""
+
+    def __init__(self, response):
+        self.response = response
+        self.url = response.geturl()
+        self.status = 200
+        self.reason = 'OK'
+        self.headers = response.headers
+
+    def read(self, amt=None):
+        return self.response.read(amt)
+
+
+def open_url(url, headers=None, method='GET'):
+    """Send a request to <url> by the shared HTTP session and return the response.
+
+    As urllib.request.urlopen, redirects are followed, HTTP errors and
+    other 3xx responses, like 304 Not Modified, raise urllib.error.HTTPError
+    and connection errors raise urllib.error.URLError.  URLs other than HTTP
+    ones are opened by urllib.request.urlopen.
+
+    Args:
+        url (str): URL of the request.
+        headers (dict): headers of the request, or None.
+        method (str): method of the request, like 'GET' or 'HEAD'.
+
+    Returns:
+        HTTPResponse, or URLResponse for a URL other than HTTP.
+    """
+
+    if not is_url(url):
+        return URLResponse(urllib.request.urlopen(urllib.request.Request(url, headers=headers or {}, method=method)))
+
+    logger = logging.getLogger(__name__)
+    logger.debug("{} {} {}".format(method, url, headers or ''))
+
+    with _http_cache_lock:
+        _http_stats['requests'] += 1
+
+    if GITHUB_TOKEN and urllib.parse.urlsplit(url).hostname == 'api.github.com':
+        headers = dict(headers or {}, Authorization='token ' + GITHUB_TOKEN)
+
+    try:
+        response = get_http_session().request(
+            method, url, headers=headers, stream=True, timeout=HTTP_TIMEOUT, allow_redirects=True)
+    except requests.exceptions.RequestException as error:
+        raise urllib.error.URLError(error)
+
+    if response.status_code >= 300:
+        try:
+            body = response.content if method != 'HEAD' else b''
+        except requests.exceptions.RequestException:
+            body = b''
+        finally:
+            response.close()
+
+        hdrs = http.client.HTTPMessage()
+        for name, value in response.headers.items():
+            hdrs[name] = value
+
+        raise urllib.error.HTTPError(response.url, response.status_code, response.reason, hdrs, io.BytesIO(body))
+
+    return HTTPResponse(response)
+
+
+def _get_cache_key(method, url, headers):
+    return method, url, tuple(sorted((headers or {}).items()))
+
+
+def _get_cached_response(key):
+    """Return the cached response for the request <key> or None, raising the HTTPError cached if any."""
+
+    with _http_cache_lock:
+        cached = _http_cache.get(key)
+        if cached is not None:
+            _http_stats['cached'] += 1
+
+    if isinstance(cached, urllib.error.HTTPError):  # Raise a copy since the body of an error is read once.
+        raise urllib.error.HTTPError(cached.url, cached.code, cached.msg, cached.hdrs, io.BytesIO())
+
+    return cached
+
+
+def _cache_response(key, response):
+    with _http_cache_lock:
+        _http_cache[key] = response
+
+
+def read_url(url, headers=None, cache=True):
+    """Return the content at <url> read by the shared HTTP session, see open_url.
+
+    The content, or the error if the resource is not found, is kept in
+    the response cache of this invocation unless <cache> is False, thus
+    read once however many times it is asked for.
+    """
+
+    key = _get_cache_key('GET', url, headers)
+    if cache and is_url(url):
+        content = _get_cached_response(key)
+        if content is not None:
+            return content
+
+    try:
+        with open_url(url, headers) as response:
+            content = response.read()
+    except urllib.error.HTTPError as error:
+        if cache and error.code in (404, 410):
+            _cache_response(key, error)
+        raise
+
+    if cache and is_url(url):
+        _cache_response(key, content)
+
+    return content
+
+
+def head_url(url):
+    """Return the response to a HEAD request to <url>, or a GET one if the server does not support HEAD.
+
+    The response is closed, only its headers are of use, and kept in the
+    response cache of this invocation.
+    """
+
+    key = _get_cache_key('HEAD', url, None)
+    response = _get_cached_response(key)
+    if response is not None:
+        return response
+
+    try:
+        response = open_url(url, method='HEAD')
+    except urllib.error.HTTPError as error:
+        if error.code not in (403, 405, 501):
+            raise
+        response = open_url(url)
+    response.close()
+
+    _cache_response(key, response)
+
+    return response
+
+
+def fetch_urls(urls, workers=DOWNLOAD_HOST_WORKERS):
+    """Read the content at each of <urls> concurrently into the response cache.
+
+    Args:
+        urls (list): URLs to read, like the possible locations of a file.
+        workers (int): maximum number of requests sent at the same time.
+
+    Returns:
+        list: content at each URL, or the urllib.error.URLError raised
+              if it cannot be read, in the order of <urls>.
+    """
+
+    def fetch(url):
+        try:
+            return read_url(url)
+        except urllib.error.URLError as error:
+            return error
+
+    if len(urls) <= 1:
+        return [fetch(url) for url in urls]
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=min(workers, len(urls))) as executor:
+        return list(executor.map(fetch, urls))
+
+
+def get_http_stats():
+    """Return the number of HTTP requests sent and answered from the response cache so far."""
+
+    with _http_cache_lock:
+        return {'requests': _http_stats['requests'], 'cached': _http_stats['cached']}
+
+
+# ----------------------------------------------------------------------
+# YAML
+# ----------------------------------------------------------------------
+
+# Use the libyaml based loader and dumper if PyYAML is built with libyaml,
+# which are many times faster than the pure Python ones.
+
+YAMLLoader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+YAMLDumper = getattr(yaml, 'CSafeDumper', yaml.SafeDumper)
+YAMLBaseLoader = getattr(yaml, 'CBaseLoader', yaml.BaseLoader)  # Loads every scalar as a string.
+
+
+class OrderedYAMLLoader(YAMLLoader):
+    """Load YAML mappings as OrderedDict to keep the order of entries, such as commands."""
+
+    def construct_ordered_mapping(self, node):
+        self.flatten_mapping(node)
+        return collections.OrderedDict(self.construct_pairs(node))
+
+
+OrderedYAMLLoader.add_constructor(
+    yaml.resolver.BaseResolver.DEFAULT_MAPPING_TAG,
+    OrderedYAMLLoader.construct_ordered_mapping)
+
+
+class OrderedYAMLDumper(YAMLDumper):
+    """Dump OrderedDict as plain YAML mappings in their order."""
+
+    def represent_ordered_mapping(self, data):
+        return self.represent_dict(data.items())
+
+
+OrderedYAMLDumper.add_representer(
+    collections.OrderedDict,
+    OrderedYAMLDumper.represent_ordered_mapping)
+
+
 # ----------------------------------------------------------------------
 # MLHUB repo and model package
 # ----------------------------------------------------------------------
 
-def get_repo(mlhub):
-    """Determine the repository to use: command line, environment, default."""
+def get_repos(mlhub):
+    """Determine the repositories to use: command line, environment, default.
 
-    repo = MLHUB
-    if mlhub is not None:
-        repo = os.path.join(repo, "")  # Ensure trailing slash.
+    Several repositories can be given separated by commas, in order of
+    precedence.
+    """
+
+    repos = [os.path.join(x.strip(), "")  # Ensure trailing slash.
+             for x in (MLHUB if mlhub is None else mlhub).split(',') if x.strip() != '']
 
     logger = logging.getLogger(__name__)
-    logger.debug("repo: {}".format(repo))
+    logger.debug("repos: {}".format(repos))
 
-    return repo
+    return repos
 
 
-def get_repo_meta_data(repo):
-    """Read the repositories meta data file and return as a list."""
+def get_repo(mlhub):
+    """Determine the repository to use, the repositories separated by commas if more than one."""
 
-    repo = get_repo(repo)
+    return ','.join(get_repos(mlhub))
+
+
+def map_repos(func, repo):
+    """Apply <func> to each repository of <repo> concurrently.
+
+    Return the list of results in the order of the repositories, where
+    the result for an inaccessible repository is None, unless none of
+    them is accessible.
+    """
+
+    repos = get_repos(repo)
+    if len(repos) == 1:
+        return [func(repos[0])]
+
+    with concurrent.futures.ThreadPoolExecutor(len(repos)) as executor:
+        futures = [executor.submit(func, x) for x in repos]
+
+    results = []
+    for x, future in zip(repos, futures):
+        try:
+            results.append(future.result())
+        except RepoAccessException:
+            logger = logging.getLogger(__name__)
+            logger.warning("Skip inaccessible repo: {}".format(x))
+            results.append(None)
+
+    if all(x is None for x in results):
+        raise RepoAccessException(repo)
+
+    return results
+
+
+def merge_repo_entries(entry_lists):
+    """Merge the lists of entries of several repositories.
+
+    The entries of a model in a repository hide the entries of the same
+    model in the repositories after it.
+    """
+
+    merged = []
+    names = set()
+    for entries in entry_lists:
+        if entries is None:
+            continue
+        merged.extend(x for x in entries if x['meta']['name'] not in names)
+        names.update(x['meta']['name'] for x in entries)
+
+    return merged
+
+
+# Downloads of repo indexes being finished in the background, keyed by the
+# dir of the cached index.
+
+_repo_index_downloads = {}
+_repo_index_downloads_lock = threading.Lock()
+
+
+def get_repo_cache_dir(repo):
+    """Return the dir where the index of <repo> is cached."""
+
+    return os.path.join(REPO_CACHE_DIR, hashlib.sha1(repo.encode()).hexdigest()[:16])
+
+
+def _read_repo_cache_state(cache_dir):
+    """Return the state of the cached index in <cache_dir> or None if not cached."""
 
     try:
-        url = repo + META_YAML
-        meta_list = list(yaml.load_all(urllib.request.urlopen(url).read(),
-                                       Loader=yaml.SafeLoader))
-    except urllib.error.URLError:
+        with open(os.path.join(cache_dir, REPO_CACHE_STATE)) as file:
+            state = json.load(file)
+    except (OSError, ValueError):
+        return None
+
+    if not os.path.exists(os.path.join(cache_dir, META_YAML)):
+        return None
+
+    return state
+
+
+def _is_repo_cache_fresh(state):
+    """Check if the cached index with <state> can be used without asking the repo."""
+
+    return state is not None and time.time() - state['fetched'] < REPO_CACHE_TTL
+
+
+def _write_repo_cache_state(cache_dir, state):
+    """Save the state of the cached index in <cache_dir>."""
+
+    write_json_file(os.path.join(cache_dir, REPO_CACHE_STATE), state)
+
+
+class RepoIndexDownload(object):
+    """Download of a repo index into its cache which can be read while downloading."""
+
+    def __init__(self, response, url, cache_dir, manifest=None, has_manifest=None):
+        self.response = response
+        self.url = url
+        self.cache_dir = cache_dir
+        self.manifest = manifest
+        self.has_manifest = has_manifest
+        self.digest = hashlib.sha256()
+        self.cache = os.path.join(cache_dir, META_YAML)
+        self.tmp = '{}.{}.tmp'.format(self.cache, os.getpid())
+
+        os.makedirs(cache_dir, exist_ok=True)
+        self.file = open(self.tmp, 'wb')
+
+    def read(self, size=-1):
+        """Read from the response and keep a copy of what was read."""
+
+        chunk = self.response.read(size if size >= 0 else None)
+        self.digest.update(chunk)
+        self.file.write(chunk)
+        return chunk
+
+    def finish(self):
+        """Download the rest of the index, save it into the cache and return its revision."""
+
+        for _ in iter(lambda: self.read(1024 * 1024), b''):
+            pass
+
+        self.file.close()
+        self.response.close()
+        os.replace(self.tmp, self.cache)
+
+        state = {'url': self.url,
+                 'etag': self.response.getheader('ETag'),
+                 'last_modified': self.response.getheader('Last-Modified'),
+                 'revision': self.digest.hexdigest(),
+                 'fetched': time.time()}
+        if self.has_manifest is False:
+            state['manifest'] = False
+
+        # Keep the manifest of the index, if any, for the next sync.
+
+        manifest = self.manifest
+        if manifest is not None and _split_cached_index(self.cache_dir, manifest['entries']) is None:
+            manifest = None  # The index changed after the manifest was downloaded.
+        _write_repo_manifest(self.cache_dir, state, manifest)
+
+        _write_repo_cache_state(self.cache_dir, state)
+
+        logger = logging.getLogger(__name__)
+        logger.debug("Cache repo index {} into {}".format(self.url, self.cache))
+
+        return state['revision']
+
+    def abort(self):
+        """Give up the download and leave the cache as it was."""
+
+        self.file.close()
+        self.response.close()
+        remove_file_or_dir(self.tmp)
+
+
+def finish_repo_index_in_background(download):
+    """Download the rest of the index of <download> into its cache in a thread.
+
+    The thread is not a daemon, thus ml only exits once the index is
+    cached, while it goes on with what it was doing meanwhile.
+    """
+
+    def finish():
         try:
-            url = repo + META_YML
-            meta_list = list(yaml.load_all(urllib.request.urlopen(url).read(),
-                                           Loader=yaml.SafeLoader))
-        except urllib.error.URLError:
+            download.finish()
+        except (OSError, http.client.HTTPException):
             logger = logging.getLogger(__name__)
-            logger.error('Repo connection problem.', exc_info=True)
-            raise RepoAccessException(repo)
+            logger.debug("Failed to cache repo index: {}".format(download.url), exc_info=True)
+            download.abort()
 
-    return meta_list, repo
+    thread = threading.Thread(target=finish)
+    with _repo_index_downloads_lock:
+        _repo_index_downloads[download.cache_dir] = thread
+    thread.start()
 
 
-def print_meta_line(entry):
-    """Print one line summary of a model."""
+def wait_repo_index(cache_dir):
+    """Wait for the index being cached into <cache_dir> in the background, if any."""
+
+    with _repo_index_downloads_lock:
+        thread = _repo_index_downloads.pop(cache_dir, None)
+
+    if thread is not None:
+        thread.join()
+
+
+def split_packages_yaml(content):
+    """Split the content of Packages.yaml, as bytes, into the list of its documents.
+
+    Each document is the lines between two lines starting with '---'.
+    """
+
+    docs = []
+    doc = None
+    for line in content.splitlines(keepends=True):
+        if line.startswith(b'---'):
+            if doc is not None:
+                docs.append(b''.join(doc))
+            doc = []
+        elif doc is not None:
+            doc.append(line)
+
+    if doc is not None:
+        docs.append(b''.join(doc))
+
+    return docs
+
+
+def _parse_repo_manifest(content):
+    """Return the entries of a repo manifest as an ordered dict of name to sha256, or None if malformed."""
+
+    # Names like yes or 1 are kept as the strings they are, rather than
+    # loaded as a bool or int, by loading every scalar as a string.
 
-    meta = entry["meta"]
-    name = meta["name"]
-    version = meta["version"]
     try:
-        title = meta["title"]
-    except KeyError:
-        title = meta["description"]
+        entries = yaml.load(content, Loader=YAMLBaseLoader)
+    except yaml.YAMLError:
+        return None
 
-    # One line message.
+    if not isinstance(entries, dict) or not all(isinstance(x, str) for x in entries.values()):
+        return None
 
-    max_title = 12
-    max_descr = 56
+    return collections.OrderedDict((str(name), digest) for name, digest in entries.items())
 
-    long = ""
-    if len(title) > max_descr:
-        long = "..."
 
-    formatter = "{0:<TITLE.TITLE} {1:^6} {2:<DESCR.DESCR}{3}".\
-        replace("TITLE", str(max_title)).replace("DESCR", str(max_descr))
-    print(formatter.format(name, version, title, long))
+def _read_repo_manifest(cache_dir):
+    """Return the entries of the manifest of the index cached in <cache_dir>, or None if not available."""
 
+    try:
+        with open(os.path.join(cache_dir, META_MANIFEST), 'rb') as file:
+            return _parse_repo_manifest(file.read())
+    except OSError:
+        return None
 
-def get_version(model=None):
-    if model is None:
-        return VERSION
-    else:
-        entry = load_description(model)
-        return entry["meta"]["version"]
 
+def _write_repo_manifest(cache_dir, state, manifest):
+    """Save <manifest> into <cache_dir> and record its ETag and Last-Modified in <state>, or forget it if None."""
 
-def check_model_installed(model):
-    """Check if model installed."""
+    path = os.path.join(cache_dir, META_MANIFEST)
+    if manifest is None:
+        remove_file_or_dir(path)
+        state.pop('manifest_etag', None)
+        state.pop('manifest_last_modified', None)
+        return
 
-    path = get_package_dir(model)
+    write_file(path, manifest['content'])
+    state['manifest_etag'] = manifest['etag']
+    state['manifest_last_modified'] = manifest['last_modified']
+
+
+def _split_cached_index(cache_dir, entries):
+    """Return the documents of the index cached in <cache_dir> by model name.
+
+    Return None if the cached index does not match the manifest <entries>.
+    """
+
+    if entries is None:
+        return None
+
+    try:
+        with open(os.path.join(cache_dir, META_YAML), 'rb') as file:
+            docs = split_packages_yaml(file.read())
+    except OSError:
+        return None
+
+    if len(docs) != len(entries):
+        return None
+
+    result = collections.OrderedDict()
+    for (name, digest), doc in zip(entries.items(), docs):
+        if hashlib.sha256(doc).hexdigest() != digest:
+            return None
+        result[name] = doc
+
+    return result
+
+
+def fetch_repo_manifest(repo, headers=None):
+    """Return the manifest of <repo>, read with the request <headers>.
+
+    The manifest is a dict of its 'content', 'etag', 'last_modified' and
+    'entries', its entries by model name or None if malformed.
+
+    Raises:
+        urllib.error.URLError, OSError or http.client.HTTPException if not
+        read, like an HTTPError 404 if <repo> does not provide a manifest.
+    """
+
+    url = repo + META_INDEX_DIR + '/' + META_MANIFEST
+    with open_url(url, headers) as response:
+        manifest = {'content': response.read(),
+                    'etag': response.getheader('ETag'),
+                    'last_modified': response.getheader('Last-Modified')}
+
+    manifest['entries'] = _parse_repo_manifest(manifest['content'])
+
+    return manifest
+
+
+def sync_repo_index(repo, cache_dir, state):
+    """Bring the cached index of <repo> up to date using the manifest of <repo>.
+
+    The manifest lists the sha256 of every entry of the index.  Only the
+    entries which are new or changed since the cached index are downloaded,
+    each from index/<name>.yaml, and patched into the cached index.
+
+    The manifest is not asked for if there is no cached index to patch,
+    or if the repo is known not to provide one, which is recorded in the
+    state of the cached index the first time it is missing.
+
+    Return (synced, manifest) where synced is whether the cached index is
+    now up to date, and manifest is the manifest of <repo> or None if not
+    available.
+    """
 
     logger = logging.getLogger(__name__)
-    logger.debug("Check if package {} is installed at: {}".format(model, path))
 
-    if not os.path.exists(path):
-        raise ModelNotInstalledException(model)
+    if state is None or state.get('manifest') is False:
+        return False, None
 
-    return True
+    url = repo + META_INDEX_DIR + '/' + META_MANIFEST
+    old_entries = _read_repo_manifest(cache_dir)
 
+    headers = {}
+    if old_entries is not None:
+        if state.get('manifest_etag') is not None:
+            headers['If-None-Match'] = state['manifest_etag']
+        if state.get('manifest_last_modified') is not None:
+            headers['If-Modified-Since'] = state['manifest_last_modified']
 
-def load_description(model):
-    """Load description of the <model>."""
+    try:
+        manifest = fetch_repo_manifest(repo, headers)
+    except urllib.error.HTTPError as error:
+        if error.code == 304 and old_entries is not None:  # Not modified since cached.
+            logger.debug("Repo manifest not modified: {}".format(url))
+            state['fetched'] = time.time()
+            _write_repo_cache_state(cache_dir, state)
+            return True, None
+        if error.code in (404, 410):  # Not provided by the repo.
+            logger.debug("Repo manifest not available: {}".format(url))
+            state['manifest'] = False
+            _write_repo_cache_state(cache_dir, state)
+        return False, None
+    except (urllib.error.URLError, OSError, http.client.HTTPException):
+        return False, None
+
+    if manifest['entries'] is None:
+        return False, None
+
+    docs = _split_cached_index(cache_dir, old_entries)
+    if docs is None:
+
+        # Keep the manifest for the next sync if it matches the cached index.
+
+        if old_entries is None and _split_cached_index(cache_dir, manifest['entries']) is not None:
+            logger.debug("Cached repo index matches the manifest: {}".format(url))
+            state['fetched'] = time.time()
+            _write_repo_manifest(cache_dir, state, manifest)
+            _write_repo_cache_state(cache_dir, state)
+            return True, manifest
+
+        return False, manifest
+
+    # Download the changed entries, unless most of them changed.
+
+    changed = [name for name, digest in manifest['entries'].items() if old_entries.get(name) != digest]
+    if len(changed) > len(manifest['entries']) / 2:
+        return False, manifest
+
+    for name in changed:
+        entry_url = repo + META_INDEX_DIR + '/' + urllib.parse.quote(name) + '.yaml'
+        logger.debug("Download changed repo index entry: {}".format(entry_url))
+        try:
+            doc = read_url(entry_url, cache=False)
+        except (urllib.error.URLError, OSError, http.client.HTTPException):
+            return False, manifest
 
-    desc = get_available_pkgyaml(model)
-    entry = read_mlhubyaml(desc)
+        if hashlib.sha256(doc).hexdigest() != manifest['entries'][name]:
+            return False, manifest
+        docs[name] = doc
 
-    return entry
+    # Patch the cached index.
 
+    content = b''.join(b'--- # ' + name.encode() + b'\n' + docs[name] for name in manifest['entries'])
 
-def read_github_raw_file(name):
-    if is_github_url(name) and name.startswith("https://api"):
-        res = json.loads(urllib.request.urlopen(name).read())
-        content = base64.b64decode(res["content"])
+    cache = os.path.join(cache_dir, META_YAML)
+    write_file(cache, content)
+
+    state['revision'] = hashlib.sha256(content).hexdigest()
+    state['fetched'] = time.time()
+    _write_repo_manifest(cache_dir, state, manifest)
+    _write_repo_cache_state(cache_dir, state)
+
+    logger.debug("Patched {} entries into cached repo index: {}".format(len(changed), cache))
+
+    return True, manifest
+
+
+def open_repo_index(repo):
+    """Check whether the cached index of <repo> is up to date.
+
+    A cached copy younger than REPO_CACHE_TTL seconds is used as is.
+    Otherwise it is synced with the manifest of the repo if available, or
+    revalidated with the ETag and Last-Modified of the previous download,
+    so that an unchanged index only costs a 304 response.  If the repo
+    cannot be reached, the cached copy, if any, is used instead.
+
+    Return None if the cached copy is to be used, otherwise a
+    RepoIndexDownload of the index.
+    """
+
+    logger = logging.getLogger(__name__)
+
+    cache_dir = get_repo_cache_dir(repo)
+    wait_repo_index(cache_dir)
+    state = _read_repo_cache_state(cache_dir)
+
+    if _is_repo_cache_fresh(state):
+        logger.debug("Use cached repo index: {}".format(cache_dir))
+        return None
+
+    # Download only changed entries if the repo provides a manifest.
+
+    synced, manifest = sync_repo_index(repo, cache_dir, state)
+    if synced:
+        return None
+
+    return download_repo_index(repo, cache_dir, state, manifest)
+
+
+def download_repo_index(repo, cache_dir, state, manifest=None, has_manifest=None):
+    """Start downloading the index of <repo> into <cache_dir> unless not modified.
+
+    <has_manifest> is False if <repo> is known not to provide a manifest,
+    which the cached <state> records otherwise.
+
+    Return None if the cached copy is to be used, otherwise a
+    RepoIndexDownload of the index.
+    """
+
+    logger = logging.getLogger(__name__)
+
+    # Try Packages.yaml then Packages.yml, or whichever worked last time first.
+
+    urls = [repo + META_YAML, repo + META_YML]
+    if state is not None:
+        urls.sort(key=lambda x: x != state['url'])
+
+    for url in urls:
+        headers = {}
+        if state is not None and state['url'] == url:
+            if state.get('etag') is not None:
+                headers['If-None-Match'] = state['etag']
+            if state.get('last_modified') is not None:
+                headers['If-Modified-Since'] = state['last_modified']
+
+        try:
+            if has_manifest is None and state is not None:
+                has_manifest = state.get('manifest')
+            return RepoIndexDownload(open_url(url, headers), url, cache_dir, manifest, has_manifest)
+        except urllib.error.HTTPError as error:
+            if error.code == 304:  # Not modified since cached.
+                logger.debug("Repo index not modified: {}".format(url))
+                if manifest is not None and _split_cached_index(cache_dir, manifest['entries']) is not None:
+                    _write_repo_manifest(cache_dir, state, manifest)
+                state['fetched'] = time.time()
+                _write_repo_cache_state(cache_dir, state)
+                return None
+        except urllib.error.URLError:
+            pass
+
+    if state is not None:
+        logger.warning("Repo not accessible, use cached repo index: {}".format(cache_dir))
+        return None
+
+    logger.error("Repo connection problem: {}".format(repo))
+    raise RepoAccessException(repo)
+
+
+def fetch_repo_index(repo):
+    """Return the local path of an up to date copy of the index of <repo>."""
+
+    download = open_repo_index(repo)
+    if download is not None:
+        try:
+            download.finish()
+        except (OSError, http.client.HTTPException):
+            download.abort()
+            raise RepoAccessException(repo)
+
+    return os.path.join(get_repo_cache_dir(repo), META_YAML)
+
+
+def fetch_repo_entry(repo, model, digest):
+    """Return the entry of <model> from index/<model>.yaml of <repo>, or None if not available.
+
+    This avoids downloading the whole index of a repo which provides an
+    entry per model.  The entry must match <digest>, its sha256 listed in
+    the manifest of <repo>.
+    """
+
+    logger = logging.getLogger(__name__)
+
+    url = repo + META_INDEX_DIR + '/' + urllib.parse.quote(model) + '.yaml'
+
+    try:
+        doc = read_url(url)
+    except (urllib.error.URLError, OSError, http.client.HTTPException):
+        return None
+
+    if hashlib.sha256(doc).hexdigest() != digest:
+        logger.warning("Repo index entry does not match the manifest: {}".format(url))
+        return None
+
+    try:
+        entry = compact_repo_entry(yaml.load(doc, Loader=YAMLLoader))
+    except (yaml.YAMLError, MalformedPackagesDotYAMLException):
+        return None
+
+    if entry['meta']['name'] != model:
+        return None
+
+    logger.debug("Read repo index entry: {}".format(url))
+
+    return entry
+
+
+def compact_repo_entry(entry):
+    """Return <entry> with only the meta data and command names kept in the compiled index.
+
+    Raises:
+        MalformedPackagesDotYAMLException: if the meta data or the name of the model is missing.
+    """
+
+    meta = entry.get('meta') if isinstance(entry, dict) else None
+    if not isinstance(meta, dict):
+        raise MalformedPackagesDotYAMLException('meta', None)
+    if 'name' not in meta:
+        raise MalformedPackagesDotYAMLException('name', None)
+
+    compact = {k: meta[k] for k in REPO_INDEX_FIELDS if k in meta}
+
+    # Only the names of the commands are kept.
+
+    commands = entry.get('commands')
+    if isinstance(commands, (dict, list)):
+        compact['commands'] = [x for x in commands if isinstance(x, str)]
+
+    return {'meta': compact}
+
+
+def _compact_repo_entry_or_warn(entry):
+    """Return the compacted <entry>, or None with a warning if malformed."""
+
+    try:
+        return compact_repo_entry(entry)
+    except MalformedPackagesDotYAMLException as e:
+        logger = logging.getLogger(__name__)
+        logger.warning("Skip repo index entry without '{}': {}".format(e.args[0], entry))
+        return None
+
+
+def compile_repo_index(meta_list, revision):
+    """Compile the entries of a repo index into a lookup table by model name.
+
+    Only the meta data needed to list and install models is kept.  If a
+    model name occurs more than once, the first entry is used for lookup.
+    Malformed entries are skipped with a warning.
+    """
+
+    entries = []
+    lookup = {}
+    for entry in meta_list:
+        compact = _compact_repo_entry_or_warn(entry)
+        if compact is None:
+            continue
+
+        lookup.setdefault(compact['meta']['name'], len(entries))
+        entries.append(compact)
+
+    return {'revision': revision, 'fields': REPO_INDEX_FIELDS, 'entries': entries, 'lookup': lookup}
+
+
+def _save_repo_index(cache_dir, index, name=REPO_CACHE_INDEX):
+    """Save the compiled <index> into <name> under <cache_dir>."""
+
+    compiled = os.path.join(cache_dir, name)
+    tmp = '{}.{}.tmp'.format(compiled, os.getpid())
+
+    try:
+        with open(tmp, 'wb') as file:
+            pickle.dump(index, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, compiled)
+    except OSError:
+        logger = logging.getLogger(__name__)
+        logger.warning("Failed to save compiled repo index: {}".format(compiled), exc_info=True)
+
+
+def _load_repo_index(cache_dir):
+    """Return the compiled index of the index cached in <cache_dir>.
+
+    The compiled index is stored next to the cached Packages.yaml and
+    only rebuilt when the cached Packages.yaml changes.
+    """
+
+    index_file = os.path.join(cache_dir, META_YAML)
+    compiled = os.path.join(cache_dir, REPO_CACHE_INDEX)
+
+    state = _read_repo_cache_state(cache_dir) or {}  # The state may be missing or unreadable.
+    revision = state.get('revision')
+    if revision is None:  # Cached before revisions were recorded.
+        revision = get_file_sha256(index_file)
+
+    try:
+        with open(compiled, 'rb') as file:
+            index = pickle.load(file)
+        if index['revision'] == revision and index.get('fields') == REPO_INDEX_FIELDS:
+            return index
+    except (OSError, EOFError, KeyError, TypeError, pickle.UnpicklingError):
+        pass
+
+    logger = logging.getLogger(__name__)
+    logger.debug("Compile repo index {} into {}".format(index_file, compiled))
+
+    with open(index_file, 'rb') as file:
+        index = compile_repo_index(yaml.load_all(file, Loader=YAMLLoader), revision)
+
+    _save_repo_index(cache_dir, index)
+
+    return index
+
+
+def get_repo_index(repo):
+    """Return the compiled index of <repo>."""
+
+    fetch_repo_index(repo)
+
+    return _load_repo_index(get_repo_cache_dir(repo))
+
+
+def _iter_search_words(value):
+    """Yield the lower case words in <value>, a string or a list or dict of them."""
+
+    if isinstance(value, dict):
+        value = list(value)
+    if isinstance(value, (list, tuple)):
+        for x in value:
+            yield from _iter_search_words(x)
+    elif value is not None:
+        yield from re.findall(r'[a-z0-9]+', str(value).lower())
+
+
+def compile_repo_search_index(index):
+    """Compile the inverted index of the compiled repo <index>.
+
+    Each word of the searched meta data maps to the positions of the
+    entries containing it and the weight of the field it occurs in.
+    """
+
+    words = {}
+    for pos, entry in enumerate(index['entries']):
+        meta = entry['meta']
+        for field, weight in REPO_SEARCH_WEIGHTS.items():
+            for word in _iter_search_words(meta.get(field)):
+                postings = words.setdefault(word, {})
+                postings[pos] = postings.get(pos, 0) + weight
+
+    return {'revision': index['revision'], 'fields': index['fields'], 'words': words, 'vocabulary': sorted(words)}
+
+
+def _load_repo_search_index(cache_dir, index):
+    """Return the inverted index of the compiled <index> cached in <cache_dir>.
+
+    The inverted index is only rebuilt when the revision of the index changes.
+    """
+
+    compiled = os.path.join(cache_dir, REPO_CACHE_SEARCH)
+
+    try:
+        with open(compiled, 'rb') as file:
+            search = pickle.load(file)
+        if search['revision'] == index['revision'] and search['fields'] == index['fields']:
+            return search
+    except (OSError, EOFError, KeyError, TypeError, pickle.UnpicklingError):
+        pass
+
+    logger = logging.getLogger(__name__)
+    logger.debug("Compile repo search index into {}".format(compiled))
+
+    search = compile_repo_search_index(index)
+    _save_repo_index(cache_dir, search, REPO_CACHE_SEARCH)
+
+    return search
+
+
+def rank_repo_search(search, terms):
+    """Rank the entries matching all the <terms> in the inverted index <search>.
+
+    A term matches the words it is a prefix of, a whole word scoring
+    higher.  Return the list of (score, position) of the matching entries,
+    the best first.
+    """
+
+    scores = None
+    vocabulary = search['vocabulary']
+    for term in set(_iter_search_words(terms)):
+        matches = {}
+        i = bisect.bisect_left(vocabulary, term)
+        while i < len(vocabulary) and vocabulary[i].startswith(term):
+            word = vocabulary[i]
+            factor = 2 if word == term else 1
+            for pos, weight in search['words'][word].items():
+                matches[pos] = max(matches.get(pos, 0), weight * factor)
+            i += 1
+
+        if scores is None:
+            scores = matches
+        else:
+            scores = {pos: score + matches[pos] for pos, score in scores.items() if pos in matches}
+
+        if not scores:
+            return []
+
+    return sorted(((score, pos) for pos, score in (scores or {}).items()), key=lambda x: (-x[0], x[1]))
+
+
+def search_repo(repo, terms):
+    """Search the models of <repo> for <terms>.
+
+    Return the list of matching entries, the best first.  A model of a
+    repository hides the same model of the repositories after it.
+    """
+
+    def search_one(x):
+        index = get_repo_index(x)
+        search = _load_repo_search_index(get_repo_cache_dir(x), index)
+        return index, rank_repo_search(search, terms)
+
+    ranked = []
+    names = set()
+    for result in map_repos(search_one, repo):
+        if result is None:
+            continue
+        index, hits = result
+        ranked.extend((score, index['entries'][pos]) for score, pos in hits
+                      if index['entries'][pos]['meta']['name'] not in names)
+        names.update(index['lookup'])
+
+    ranked.sort(key=lambda x: -x[0])  # Stable, thus the repository order is kept on ties.
+
+    return [entry for score, entry in ranked]
+
+
+def _stream_repo_index(repo, download):
+    """Yield the compacted entries of the index of <repo> while it is being downloaded.
+
+    If the caller stops early, the rest of the index is downloaded into
+    the cache in the background, and compiled later when needed.
+    """
+
+    entries = []
+    try:
+        for entry in yaml.load_all(download, Loader=YAMLLoader):
+            entry = _compact_repo_entry_or_warn(entry)
+            if entry is not None:
+                entries.append(entry)
+                yield entry
+
+        revision = download.finish()
+        _save_repo_index(download.cache_dir, compile_repo_index(entries, revision))
+
+    except GeneratorExit:
+        finish_repo_index_in_background(download)
+        raise
+
+    except (OSError, http.client.HTTPException):
+        download.abort()
+        raise RepoAccessException(repo)
+
+    except BaseException:
+        download.abort()
+        raise
+
+
+def iter_repo_meta_data(repo):
+    """Return an iterator over the meta data of the models of <repo>.
+
+    If the cached index is up to date the compiled index is used, otherwise
+    the entries are available as soon as they are parsed while the index is
+    being downloaded.  The indexes of several repositories are read
+    concurrently and merged.
+    """
+
+    if len(get_repos(repo)) > 1:
+        return iter(merge_repo_entries(map_repos(lambda x: get_repo_index(x)['entries'], repo)))
+
+    download = open_repo_index(repo)
+    if download is None:
+        return iter(_load_repo_index(get_repo_cache_dir(repo))['entries'])
+
+    return _stream_repo_index(repo, download)
+
+
+def get_repo_meta_data(repo):
+    """Read the repositories meta data and return as a list."""
+
+    repo = get_repo(repo)
+
+    return list(iter_repo_meta_data(repo)), repo
+
+
+def print_meta_line(entry):
+    """Print one line summary of a model."""
+
+    meta = entry["meta"]
+    name = meta["name"]
+    version = meta["version"]
+    try:
+        title = meta["title"]
+    except KeyError:
+        title = meta["description"]
+
+    # One line message.
+
+    max_title = 12
+    max_descr = 56
+
+    long = ""
+    if len(title) > max_descr:
+        long = "..."
+
+    formatter = "{0:<TITLE.TITLE} {1:^6} {2:<DESCR.DESCR}{3}".\
+        replace("TITLE", str(max_title)).replace("DESCR", str(max_descr))
+    print(formatter.format(name, version, title, long))
+
+
+def get_version(model=None):
+    if model is None:
+        return VERSION
+    else:
+        entry = load_description(model)
+        return entry["meta"]["version"]
+
+
+def check_model_installed(model):
+    """Check if model installed."""
+
+    path = get_package_dir(model)
+
+    logger = logging.getLogger(__name__)
+    logger.debug("Check if package {} is installed at: {}".format(model, path))
+
+    if not os.path.exists(path):
+        raise ModelNotInstalledException(model)
+
+    return True
+
+
+def load_description(model):
+    """Load description of the <model>."""
+
+    desc = get_available_pkgyaml(model)
+    entry = read_mlhubyaml(desc)
+
+    return entry
+
+
+def read_github_raw_file(name):
+    if is_github_url(name) and name.startswith("https://api"):
+        res = read_github_api(name)
+        content = base64.b64decode(res["content"])
     elif is_url(name):
-        content = urllib.request.urlopen(name).read()
+        content = read_url(name)
     else:
         content = open(name)
 
-    return content
+    return content
+
+
+def read_mlhubyaml(name):
+    """Read description from a specified local yaml file or the url of a yaml file."""
+
+    try:
+
+        # Use OrderedYAMLLoader to keep the order of entries specified inside YAML file.
+        # Because the order of commands matters.
+
+        entry = yaml.load(read_github_raw_file(name), Loader=OrderedYAMLLoader)
+
+    except (yaml.composer.ComposerError, yaml.scanner.ScannerError):
+
+        raise MalformedYAMLException(name)
+
+    except urllib.error.URLError:
+
+        raise YAMLFileAccessException(name)
+
+    return entry
+
+
+def _find_repo_model(repo, model):
+    """Find <model> in <repo>.
+
+    Return the meta data of the model, or None if not found, and the list
+    of model meta data read.
+    """
+
+    cache_dir = get_repo_cache_dir(repo)
+    wait_repo_index(cache_dir)
+    state = _read_repo_cache_state(cache_dir)
+
+    download = None
+    if not _is_repo_cache_fresh(state):
+        has_manifest = None
+        if state is None:  # Nothing cached to sync, but the manifest may list the model.
+            synced = False
+            try:
+                manifest = fetch_repo_manifest(repo)
+                if manifest['entries'] is None:
+                    manifest = None
+            except urllib.error.HTTPError as error:
+                manifest = None
+                if error.code in (404, 410):  # Not provided by the repo.
+                    has_manifest = False
+            except (urllib.error.URLError, OSError, http.client.HTTPException):
+                manifest = None
+        else:
+            synced, manifest = sync_repo_index(repo, cache_dir, state)
+
+        if not synced:
+
+            # Read only the entry of the model if the index is not cached
+            # or cannot be patched, and the manifest of the repo lists the
+            # model.  Otherwise the whole index is downloaded.
+
+            if manifest is not None and model in manifest['entries']:
+                entry = fetch_repo_entry(repo, model, manifest['entries'][model])
+                if entry is not None:
+                    return entry['meta'], [entry]
+
+            download = download_repo_index(repo, cache_dir, state, manifest, has_manifest)
+
+    # Find the first matching entry in the meta data.
+
+    if download is None:  # Look up the compiled index.
+        index = _load_repo_index(cache_dir)
+        meta_list = index['entries']
+        return meta_list[index['lookup'][model]]['meta'] if model in index['lookup'] else None, meta_list
+
+    # Stop parsing the index being downloaded at the first match.
+
+    meta_list = []
+    stream = _stream_repo_index(repo, download)
+    try:
+        for entry in stream:
+            meta_list.append(entry)
+            if model == entry['meta']['name']:
+                return entry['meta'], meta_list
+    finally:
+        stream.close()
+
+    return None, meta_list
+
+
+def get_model_info_from_repo(model, repo):
+    """Get model url on mlhub.
+
+    Args:
+        model (str): model name.
+        repo (str): packages list url, or urls separated by commas.
+
+    Returns:
+        url: model url for download.
+        version: model version if url refers to an archive.
+        checksum: dict of the expected 'sha256' and/or 'size' of the archive
+                  if url refers to an archive and they are given, otherwise None.
+        meta: list of model meta data read, up to the model if the
+              index had to be downloaded.
+
+    Raises:
+        ModelNotFoundOnRepoException
+    """
+
+    url = None
+    version = None
+    checksum = None
+    repo = get_repo(repo)
+
+    # Search the repositories concurrently and use the first one providing the model.
+
+    meta = None
+    meta_list = []
+    for result in map_repos(lambda x: _find_repo_model(x, model), repo):
+        if result is not None:
+            meta_list = merge_repo_entries([meta_list, result[1]])
+            if meta is None:
+                meta = result[0]
+
+    if meta is not None:
+        try:
+            if "yaml" in meta:
+                url = meta["yaml"]
+            else:
+                url = meta["url"]
+
+            # If url refers to an archive, its version must be known.
+
+            if is_archive(url):
+                version = meta["version"]
+                checksum = {k: meta[k] for k in ('sha256', 'size') if k in meta} or None
+
+        except KeyError as e:
+            raise MalformedPackagesDotYAMLException(e.args[0], model)
+
+    # If not found suggest how a model might be installed.
+
+    if url is None:
+        logger = logging.getLogger(__name__)
+        logger.error("Model '{}' not found on Repo '{}'.".format(model, repo))
+        raise ModelNotFoundOnRepoException(model, repo)
+
+    return url, version, checksum, meta_list
+
+
+def interpret_mlm_name(mlm):
+    """Interpret model package file name into model name and version number.
+
+    Args:
+        mlm (str): mlm file path or url.
+
+    Returns:
+        file name, model name, version number.
+    """
+
+    if not ends_with_mlm(mlm):
+        raise MalformedMLMFileNameException(mlm)
+
+    mlmfile = os.path.basename(mlm)
+    try:
+        model, version = mlmfile.split('_')
+    except ValueError:
+        raise MalformedMLMFileNameException(mlm)
+
+    version = '.'.join(version.split('.')[: -1])
+
+    return model, version
+
+
+def get_available_pkgyaml(url):
+    """Return the available package yaml file path.
+
+    Possible options are MLHUB.yaml, DESCRIPTION.yaml or DESCRIPTION.yml.
+    If both exist, MLHUB.yaml takes precedence.
+    Path can be a path to the package directory or a URL to the top level of the pacakge repo
+    """
+
+    yaml_list = [MLHUB_YAML, DESC_YAML, DESC_YML]
+
+    if is_github_url(url):
+        yaml_list = [url.format(x) for x in yaml_list]
+    elif is_url(url):
+        yaml_list = ['/'.join([url, x]) for x in yaml_list]
+    else:
+        if os.path.sep not in url:  # url is a model name
+            url = os.path.join(get_init_dir(), url)
+        yaml_list = [os.path.join(url, x) for x in yaml_list]
+
+    logger = logging.getLogger(__name__)
+    logger.info("Finding MLHUB.yaml ...")
+    logger.debug("Possible locations: {}".format(yaml_list))
+
+    if is_url(url):
+
+        # Probe MLHUB.yaml first, which most packages provide, and only
+        # then the other locations at the same time.  The content of the
+        # one found is kept in the response cache to be read from there.
+
+        param = yaml_list[0]
+        contents = fetch_urls(yaml_list[:1])
+        if isinstance(contents[0], urllib.error.URLError):
+            contents += fetch_urls(yaml_list[1:])
+        for x, content in zip(yaml_list, contents):
+            if not isinstance(content, urllib.error.URLError):
+                logger.debug("YAML: {}".format(x))
+                return x
+    else:
+        param = url
+        for x in yaml_list:
+            if os.path.exists(x):
+                logger.debug("YAML: {}".format(x))
+                return x
+
+    raise DescriptionYAMLNotFoundException(param)
+
+
+# ----------------------------------------------------------------------
+# String manipulation
+# ----------------------------------------------------------------------
+
+def dropdot(sentence):
+    """Drop the period after a sentence."""
+    return re.sub("[.]$", "", sentence)
+
+
+def drop_newline(paragraph):
+    """Drop trailing newlines."""
+
+    return re.sub("\n$", "", paragraph)
+
+
+def lower_first_letter(sentence):
+    """Lowercase the first letter of a sentence."""
+
+    return sentence[:1].lower() + sentence[1:] if sentence else ''
+
+
+# ----------------------------------------------------------------------
+# URL and download
+# ----------------------------------------------------------------------
+
+def is_url(name):
+    """Check if name is a url."""
+
+    return re.findall('http[s]?:', name)
+
+
+def get_url_filename(url):
+    """Obtain the file name from URL or None if not available."""
+
+    return get_response_filename(url, head_url(url))
+
+
+def get_response_filename(url, response):
+    """Obtain the file name from the <response> to <url> or None if not available."""
+
+    info = response.getheader('Content-Disposition')
+    if info is None:  # File name can be obtained from URL per se.
+        filename = os.path.basename(url)
+        if filename == '':
+            filename = None
+    else:  # File name may be obtained from 'Content-Disposition'.
+        _, params = cgi.parse_header(info)
+        if 'filename' in params:
+            filename = params['filename']
+        else:
+            filename = None
+
+    return filename
+
+
+class HostLimiter(object):
+    """Limit the number of concurrent requests to the same host.
+
+    Use as:
+
+        limiter = HostLimiter(4)
+        with limiter(url):
+            ...
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.semaphores = {}
+        self.lock = threading.Lock()
+
+    def __call__(self, url):
+        """Return the semaphore of the host of <url>."""
+
+        host = urllib.parse.urlparse(url).netloc if is_url(url) else 'github.com'
+        with self.lock:
+            if host not in self.semaphores:
+                self.semaphores[host] = threading.BoundedSemaphore(self.limit)
+            return self.semaphores[host]
+
+    def acquire_free(self, url, count):
+        """Take up to <count> more requests to the host of <url>, only those free now.
+
+        Returns:
+            the number of requests taken, to be given back by release().
+        """
+
+        semaphore = self(url)
+        taken = 0
+        while taken < count and semaphore.acquire(blocking=False):
+            taken += 1
+        return taken
+
+    def release(self, url, count):
+        """Give back <count> requests to the host of <url> taken by acquire_free()."""
+
+        semaphore = self(url)
+        for _ in range(count):
+            semaphore.release()
+
+
+def _read_part_state(part):
+    """Return the state of the partially downloaded file <part>, or None."""
+
+    try:
+        with open(part + '.json') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_part_state(part, state):
+    """Record the <state> of the partially downloaded file <part> for resuming it.
+
+    The state holds the 'etag' and 'last_modified' validators of the file,
+    and for a segmented download its 'size' and 'segments'.
+    """
+
+    tmp = '{}.json.{}.tmp'.format(part, os.getpid())
+    with open(tmp, 'w') as file:
+        json.dump(state, file)
+    os.replace(tmp, part + '.json')
+
+
+def _get_validator(state):
+    """Return the validator of <state> usable in If-Range, or None."""
+
+    validator = state.get('etag') or state.get('last_modified')
+    if validator is None or validator.startswith('W/'):  # Weak ETags cannot be used in If-Range.
+        return None
+    return validator
+
+
+def _plan_segments(response, segments):
+    """Return the state of a download of <response> split into <segments>, or None if not possible.
+
+    The server must accept byte ranges and the file must be large enough
+    and have a validator, so that the ranges are known to be from the same
+    file.  Each segment is a list of its start, end and the position of
+    the next byte to download.
+    """
+
+    size = response.getheader('Content-Length')
+    state = {'etag': response.getheader('ETag'),
+             'last_modified': response.getheader('Last-Modified')}
+
+    if (response.status != 200 or response.getheader('Accept-Ranges') != 'bytes'
+            or size is None or _get_validator(state) is None):
+        return None
+
+    size = int(size)
+    count = min(segments, size // DOWNLOAD_SEGMENT_SIZE)
+    if count < 2:
+        return None
+
+    bounds = [size * i // count for i in range(count + 1)]
+    state.update(size=size, segments=[[bounds[i], bounds[i + 1], bounds[i]] for i in range(count)])
+
+    return state
+
+
+class DownloadHasher(object):
+    """Compute the sha256 of a file while it is being downloaded.
+
+    The bytes are hashed in the order of the file.  Those downloaded in
+    order are hashed as they arrive, without reading them back from the
+    file.  Only those downloaded ahead, by other segments or by a previous
+    run, are read back from the file once the bytes before them are hashed.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.pos = 0
+        self.sha256 = hashlib.sha256()
+        self.lock = threading.Lock()
+
+    def reset(self):
+        """Restart hashing from the start of the file."""
+
+        with self.lock:
+            self.pos = 0
+            self.sha256 = hashlib.sha256()
+
+    def update(self, offset, data):
+        """Hash <data> written at <offset> of the file if the bytes before it are hashed."""
+
+        with self.lock:
+            if offset == self.pos:
+                self.sha256.update(data)
+                self.pos += len(data)
+
+    def catch_up(self, end):
+        """Hash the bytes of the file not hashed yet up to <end>, which have been written."""
+
+        with self.lock:
+            if self.pos >= end:
+                return
+
+            with open(self.path, 'rb') as file:
+                file.seek(self.pos)
+                while self.pos < end:
+                    chunk = file.read(min(1024 * 1024, end - self.pos))
+                    if not chunk:
+                        break
+                    self.sha256.update(chunk)
+                    self.pos += len(chunk)
+
+    def hexdigest(self):
+        return self.sha256.hexdigest()
+
+
+def _download_segments(url, part, state, response, retries, hasher, workers):
+    """Download the segments of <url> into <part> concurrently, according to <state>.
+
+    The segments are written at their offsets into the preallocated
+    <part>, by at most <workers> at the same time.  The positions reached
+    are recorded into the state of <part>, when interrupted, to resume
+    from there.  <response>, if not None, is the response to a GET of the
+    whole file, used for the first segment.  The file is hashed by
+    <hasher> while being downloaded.
+
+    Returns:
+        False if the file has changed since <state> was planned, otherwise True.
+    """
+
+    logger = logging.getLogger(__name__)
+    logger.debug("Download {} in {} segments".format(url, len(state['segments'])))
+
+    validator = _get_validator(state)
+    stop = threading.Event()
+
+    if not os.path.exists(part):
+        with open(part, 'wb') as file:
+            if hasattr(os, 'posix_fallocate'):
+                os.posix_fallocate(file.fileno(), 0, state['size'])
+            else:
+                file.truncate(state['size'])
+    _write_part_state(part, state)
+
+    def _get_contiguous():  # End of the bytes downloaded from the start of the file.
+        for segment in state['segments']:
+            if segment[2] < segment[1]:
+                return segment[2]
+        return state['size']
+
+    hasher.catch_up(_get_contiguous())
+
+    def _fetch(segment, response):
+        attempt = 0
+        while segment[2] < segment[1]:
+            try:
+                if response is None:
+                    headers = {'Range': 'bytes={}-{}'.format(segment[2], segment[1] - 1), 'If-Range': validator}
+                    response = open_url(url, headers)
+                    content_range = response.getheader('Content-Range') or ''
+                    if response.status != 206 or not content_range.startswith('bytes {}-'.format(segment[2])):
+                        response.close()
+                        return False
+
+                with response, open(part, 'r+b') as file:
+                    file.seek(segment[2])
+                    while segment[2] < segment[1]:
+                        if stop.is_set():
+                            return True
+                        chunk = response.read(min(1024 * 1024, segment[1] - segment[2]))
+                        if not chunk:
+                            raise http.client.IncompleteRead(b'', segment[1] - segment[2])
+                        file.write(chunk)
+                        file.flush()
+                        hasher.update(segment[2], chunk)
+                        segment[2] += len(chunk)
+                        hasher.catch_up(_get_contiguous())
+                response = None
+
+            except urllib.error.HTTPError:
+                raise
+
+            except (urllib.error.URLError, OSError, http.client.HTTPException) as error:
+                if response is not None:
+                    response.close()
+                    response = None
+
+                attempt += 1
+                if attempt > retries:
+                    raise
+
+                logger.warning("Download of {} interrupted, retrying: {}".format(url, error))
+                time.sleep(min(2 ** (attempt - 1), 30))
+
+        return True
+
+    try:
+        with concurrent.futures.ThreadPoolExecutor(max(1, min(workers, len(state['segments'])))) as executor:
+            futures = [executor.submit(_fetch, segment, response if i == 0 else None)
+                       for i, segment in enumerate(state['segments'])]
+            try:
+                if not all([future.result() for future in futures]):
+                    return False
+            except BaseException:
+                stop.set()
+                raise
+    finally:
+        _write_part_state(part, state)
+
+    hasher.catch_up(state['size'])
+
+    return True
+
+
+def _download_stream(url, part, response, retries, hasher):
+    """Download <url> into <part> in a single stream, resuming <part> if possible.
+
+    <response>, if not None, is the response to a GET of the whole file.
+    The file is hashed by <hasher> while being downloaded, which only
+    reads back the part downloaded by a previous run.
+    """
+
+    logger = logging.getLogger(__name__)
+
+    attempt = 0
+    while True:
+        offset = os.path.getsize(part) if os.path.exists(part) else 0
+        try:
+
+            # Ask for the rest of the file only if it has not changed since.
+
+            if offset != 0:
+                if response is not None:
+                    response.close()
+                    response = None
+
+                validator = _get_validator(_read_part_state(part) or {})
+                if validator is not None:
+                    headers = {'Range': 'bytes={}-'.format(offset), 'If-Range': validator}
+                    response = open_url(url, headers)
+                else:
+                    offset = 0
+
+            if response is None:
+                response = open_url(url)
+
+            # Append to the .part file only if the server sent the rest of it.
+
+            content_range = response.getheader('Content-Range') or ''
+            if response.status == 206 and content_range.startswith('bytes {}-'.format(offset)):
+                logger.debug("Resume download of {} from byte {}".format(url, offset))
+                total = content_range.rpartition('/')[2]
+                total = int(total) if total.isdigit() else None
+                mode = 'ab'
+            else:
+                offset = 0
+                total = response.getheader('Content-Length')
+                total = int(total) if total is not None else None
+                mode = 'wb'
+
+            if hasher.pos != offset:  # Restarted, or resuming a previous run.
+                hasher.reset()
+                hasher.catch_up(offset)
+
+            with response, open(part, mode) as file:
+                if mode == 'wb':
+                    _write_part_state(part, {'etag': response.getheader('ETag'),
+                                             'last_modified': response.getheader('Last-Modified')})
+                while True:
+                    chunk = response.read(1024 * 1024)
+                    if not chunk:
+                        break
+                    file.write(chunk)
+                    hasher.update(offset, chunk)
+                    offset += len(chunk)
+            response = None
+
+            # The connection may be dropped without any error before the file is complete.
+
+            size = os.path.getsize(part)
+            if total is not None and size < total:
+                raise http.client.IncompleteRead(b'', total - size)
+
+            return
+
+        except urllib.error.HTTPError as error:
+            if error.code == 416:  # The .part file is not a prefix of the file any more.
+                os.remove(part)
+                attempt += 1
+                if attempt <= retries:
+                    continue
+            raise
+
+        except (urllib.error.URLError, OSError, http.client.HTTPException) as error:
+            if response is not None:
+                response.close()
+                response = None
+
+            attempt += 1
+            if attempt > retries:
+                raise
+
+            logger.warning("Download of {} interrupted, retrying: {}".format(url, error))
+            time.sleep(min(2 ** (attempt - 1), 30))
+
+
+def download_file(url, path, response=None, retries=DOWNLOAD_RETRIES, segments=DOWNLOAD_SEGMENTS, checksum=None):
+    """Download <url> into <path>, resuming the download if interrupted.
+
+    The file is downloaded into <path>.part, which is only moved to
+    <path> once complete.  A dropped connection is resumed by a Range
+    request, as well as the .part file left by a previous run, if the
+    server supports it and the file has not changed since.  If the server
+    accepts byte ranges, a large file is downloaded in <segments>
+    concurrently over as many connections, and a segmented download left
+    by a previous run over no more than <segments> connections.  The file
+    is hashed while being downloaded and checked against <checksum> if
+    given.
+
+    Args:
+        url (str): URL of the file.
+        path (str): local path of the file.
+        response (HTTPResponse): the response to a GET of <url>
+                                              already made, or None.
+        retries (int): number of times a dropped download is resumed.
+        segments (int): maximum number of segments downloaded concurrently.
+        checksum (dict): the expected 'sha256' and/or 'size' of the file, or None.
+
+    Returns:
+        the sha256 of the file.
+
+    Raises:
+        urllib.error.URLError, OSError or http.client.HTTPException if the
+        download failed more than <retries> times.
+
+        DownloadChecksumException if the file does not match <checksum>.
+    """
+
+    part = path + EXT_PART
+    state = _read_part_state(part) if os.path.exists(part) else None
+    hasher = DownloadHasher(part)
+
+    # Plan a segmented download unless a single stream download is to be resumed.
+
+    if state is None and segments > 1:
+        if os.path.exists(part):
+            os.remove(part)
+        if response is None:
+            response = open_url(url)
+        state = _plan_segments(response, segments)
+
+    if state is not None and 'segments' in state:
+        if response is not None and os.path.exists(part):  # Resume the segments instead.
+            response.close()
+            response = None
+
+        if not _download_segments(url, part, state, response, retries, hasher, segments):
+            logger = logging.getLogger(__name__)
+            logger.debug("{} changed since partially downloaded, restart".format(url))
+            os.remove(part)
+            os.remove(part + '.json')
+            return download_file(url, path, None, retries, segments, checksum)
+    else:
+        _download_stream(url, part, response, retries, hasher)
+
+    # Check the file before it can be used.
 
+    sha256 = hasher.hexdigest()
+    if checksum is not None:
+        actual = {'sha256': sha256, 'size': os.path.getsize(part)}
+        if any(str(checksum[k]).lower() != str(actual[k]) for k in actual if k in checksum):
+            os.remove(part)
+            if os.path.exists(part + '.json'):
+                os.remove(part + '.json')
+            raise DownloadChecksumException(url, checksum, actual)
 
-def read_mlhubyaml(name):
-    """Read description from a specified local yaml file or the url of a yaml file."""
+    os.replace(part, path)
+    if os.path.exists(part + '.json'):
+        os.remove(part + '.json')
 
-    try:
+    return sha256
 
-        # Use yamlordereddictloader to keep the order of entries specified inside YAML file.
-        # Because the order of commands matters.
 
-        entry = yaml.load(read_github_raw_file(name),
-                          Loader=yamlordereddictloader.Loader)
+def is_file_checksum(path, checksum):
+    """Check whether the file at <path> matches <checksum>, the expected 'sha256' and/or 'size'.
 
-    except (yaml.composer.ComposerError, yaml.scanner.ScannerError):
+    A file linked to the file with the same sha256 in the download store
+    is known to match without being read.
+    """
 
-        raise MalformedYAMLException(name)
+    if 'size' in checksum and os.path.getsize(path) != int(checksum['size']):
+        return False
 
-    except urllib.error.URLError:
+    if 'sha256' not in checksum:
+        return True
 
-        raise YAMLFileAccessException(name)
+    sha256 = str(checksum['sha256']).lower()
+    blob = get_store_blob(sha256)
+    if os.path.exists(blob) and os.path.samefile(path, blob):
+        return True
 
-    return entry
+    return get_file_sha256(path) == sha256
 
 
-def get_model_info_from_repo(model, repo):
-    """Get model url on mlhub.
+def download_model_pkg(url, local, pkgfile, quiet, segments=DOWNLOAD_SEGMENTS, checksum=None):
+    """Download the model package mlm or zip file from <url> to <local>.
 
-    Args:
-        model (str): model name.
-        repo (str): packages list url.
+    A large package is downloaded in up to <segments> concurrently.  If the
+    expected sha256 is given by <checksum>, the package is linked from the
+    download store if there, otherwise it is checked once downloaded.  The
+    archive of a GitHub commit is downloaded once into the download store.
+    """
 
-    Returns:
-        url: model url for download.
-        meta: list of all model meta data.
+    if not quiet:
+        print("Package " + url + "\n")
 
-    Raises:
-        ModelNotFoundOnRepoException
-    """
+    if checksum is not None and 'sha256' in checksum:
+        sha256 = str(checksum['sha256']).lower()
+        if has_store_blob(sha256):
+            if not quiet:
+                print("Using the copy of '{}' found in the download store ...\n".format(pkgfile))
+            link_store_blob(sha256, local)
+            return
 
-    url = None
-    version = None
-    meta_list, repo = get_repo_meta_data(repo)
+    # The archive of a GitHub commit never changes, thus is kept in the download store.
 
-    # Find the first matching entry in the meta data.
+    immutable = is_github_commit_archive(url)
+    if immutable:
+        record = read_store_url(url)
+        if record is not None:
+            if not quiet:
+                print("Using the copy of '{}' found in the download store ...\n".format(pkgfile))
+            link_store_blob(record['sha256'], local)
+            return
+
+    meta = open_url(url)
+    if meta.status != 200:
+        raise ModelURLAccessException(url)
+
+    # Content-Length is not always necessarily available.
+
+    dsize = meta.getheader("Content-Length")
+    if dsize is not None:
+        dsize = "{:,}".format(int(dsize))
+
+    if not quiet:
+        msg = "Downloading '{}'".format(pkgfile)
+        if dsize is not None:
+            msg += " ({} bytes)".format(dsize)
+        msg += " ...\n"
+        print(msg)
+
+    # Download the archive from the URL, reusing the response.
 
     try:
-        for entry in meta_list:
-            meta = entry["meta"]
-            if model == meta["name"]:
-                if "yaml" in meta:
-                    url = meta["yaml"]
-                else:
-                    url = meta["url"]
+        if immutable:
+            record = store_download(url, pkgfile, meta, segments=segments, checksum=checksum)
+            link_store_blob(record['sha256'], local)
+        else:
+            download_file(url, local, meta, segments=segments, checksum=checksum)
+    except urllib.error.URLError as error:
+        raise ModelDownloadHaltException(url, str(error.reason).lower())
+    except (OSError, http.client.HTTPException) as error:
+        raise ModelDownloadHaltException(url, str(error).lower())
 
-                # If url refers to an archive, its version must be known.
 
-                if is_archive(url):
-                    version = meta["version"]
+# ----------------------------------------------------------------------
+# Download store
+# ----------------------------------------------------------------------
 
-                break
-    except KeyError as e:
-        raise MalformedPackagesDotYAMLException(e.args[0], model)
+def get_store_blob(sha256):
+    """Return the path of the file with <sha256> in the download store."""
 
-    # If not found suggest how a model might be installed.
+    return os.path.join(STORE_DIR, 'sha256', sha256[:2], sha256)
 
-    if url is None:
-        logger = logging.getLogger(__name__)
-        logger.error("Model '{}' not found on Repo '{}'.".format(model, repo))
-        raise ModelNotFoundOnRepoException(model, repo)
 
-    return url, version, meta_list
+def _get_store_url_record(url):
+    """Return the path of the record of the file downloaded from <url> into the download store."""
 
+    return os.path.join(STORE_DIR, 'url', hashlib.sha256(url.encode('utf-8')).hexdigest() + '.json')
 
-def interpret_mlm_name(mlm):
-    """Interpret model package file name into model name and version number.
 
-    Args:
-        mlm (str): mlm file path or url.
+def has_store_blob(sha256):
+    """Check if the file with <sha256> is in the download store and intact.
 
-    Returns:
-        file name, model name, version number.
+    Files in the store are read-only with their mtime set to 0, see
+    _seal_store_blob, thus one modified since, through a link from a
+    package, has another mtime.  It is then checked again, and removed
+    from the store if its content changed.
     """
 
-    if not ends_with_mlm(mlm):
-        raise MalformedMLMFileNameException(mlm)
-
-    mlmfile = os.path.basename(mlm)
+    blob = get_store_blob(sha256)
     try:
-        model, version = mlmfile.split('_')
-    except ValueError:
-        raise MalformedMLMFileNameException(mlm)
+        if os.stat(blob).st_mtime == 0:
+            return True
+        if get_file_sha256(blob) == sha256:
+            _seal_store_blob(blob)
+            return True
+        logger = logging.getLogger(__name__)
+        logger.warning("Removed {} modified in the download store.".format(blob))
+        os.remove(blob)
+    except OSError:
+        pass
 
-    version = '.'.join(version.split('.')[: -1])
+    return False
 
-    return model, version
 
+def _seal_store_blob(blob):
+    """Make the file <blob> of the download store read-only with its mtime set to 0, see has_store_blob."""
 
-def get_available_pkgyaml(url):
-    """Return the available package yaml file path.
+    os.chmod(blob, 0o444)
+    os.utime(blob, (0, 0))
 
-    Possible options are MLHUB.yaml, DESCRIPTION.yaml or DESCRIPTION.yml.
-    If both exist, MLHUB.yaml takes precedence.
-    Path can be a path to the package directory or a URL to the top level of the pacakge repo
+
+def read_store_url(url):
+    """Return the record of the file downloaded from <url> if in the download store, otherwise None.
+
+    The record is a dict of the 'url', the 'sha256' and the 'filename' of
+    the file, and the 'etag' and 'last_modified' of the response it was
+    downloaded from, to ask if it has been modified since.
     """
 
-    yaml_list = [MLHUB_YAML, DESC_YAML, DESC_YML]
+    try:
+        with open(_get_store_url_record(url)) as file:
+            record = json.load(file)
+        if has_store_blob(record['sha256']):
+            return record
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
 
-    if is_github_url(url):
-        yaml_list = [url.format(x) for x in yaml_list]
-    elif is_url(url):
-        yaml_list = ['/'.join([url, x]) for x in yaml_list]
-    else:
-        if os.path.sep not in url:  # url is a model name
-            url = os.path.join(get_init_dir(), url)
-        yaml_list = [os.path.join(url, x) for x in yaml_list]
+    return None
 
-    logger = logging.getLogger(__name__)
-    logger.info("Finding MLHUB.yaml ...")
-    logger.debug("Possible locations: {}".format(yaml_list))
 
-    if is_url(url):
-        param = yaml_list[0]
-        for x in yaml_list:
-            try:
-                if urllib.request.urlopen(x).status == 200:
-                    logger.debug("YAML: {}".format(x))
-                    return x
-            except urllib.error.URLError:
-                continue
-    else:
-        param = url
-        for x in yaml_list:
-            if os.path.exists(x):
-                logger.debug("YAML: {}".format(x))
-                return x
+def store_download(url, filename, response=None, segments=DOWNLOAD_SEGMENTS, checksum=None):
+    """Download <url> into the download store, unless a file with the same content is there.
 
-    raise DescriptionYAMLNotFoundException(param)
+    Args:
+        url (str): URL of the file.
+        filename (str): name of the file, recorded to be known without a request.
+        response (HTTPResponse): the response to a GET of <url>
+                                              already made, or None.
+        segments (int): maximum number of segments downloaded concurrently.
+        checksum (dict): the expected 'sha256' and/or 'size' of the file, or None.
 
+    Returns:
+        the record of the file, see read_store_url.
+    """
 
-# ----------------------------------------------------------------------
-# String manipulation
-# ----------------------------------------------------------------------
+    # Download into a path determined by the URL so that interrupted downloads are resumed.
 
-def dropdot(sentence):
-    """Drop the period after a sentence."""
-    return re.sub("[.]$", "", sentence)
+    tmp_dir = os.path.join(STORE_DIR, 'tmp')
+    os.makedirs(tmp_dir, exist_ok=True)
+    tmp = os.path.join(tmp_dir, hashlib.sha256(url.encode('utf-8')).hexdigest())
+    validators = None
+    if response is not None:
+        validators = {'etag': response.getheader('ETag'), 'last_modified': response.getheader('Last-Modified')}
 
+    sha256 = download_file(url, tmp, response, segments=segments, checksum=checksum)
+    blob = get_store_blob(sha256)
+    os.makedirs(os.path.dirname(blob), exist_ok=True)
+    _seal_store_blob(tmp)
+    os.replace(tmp, blob)
 
-def drop_newline(paragraph):
-    """Drop trailing newlines."""
+    return write_store_url(url, sha256, filename, validators)
 
-    return re.sub("\n$", "", paragraph)
 
+def write_store_url(url, sha256, filename, validators=None):
+    """Record that the file downloaded from <url> is the file with <sha256> in the download store.
 
-def lower_first_letter(sentence):
-    """Lowercase the first letter of a sentence."""
+    The 'etag' and 'last_modified' of the response it was downloaded from
+    are recorded too if given by <validators>.
 
-    return sentence[:1].lower() + sentence[1:] if sentence else ''
+    Returns:
+        the record of the file, see read_store_url.
+    """
 
+    record = {'url': url, 'sha256': sha256, 'filename': filename}
+    record.update(validators or {})
+    write_json_file(_get_store_url_record(url), record)
 
-# ----------------------------------------------------------------------
-# URL and download
-# ----------------------------------------------------------------------
+    return record
 
-def is_url(name):
-    """Check if name is a url."""
 
-    return re.findall('http[s]?:', name)
+def link_store_blob(sha256, path, writable=False):
+    """Link the file with <sha256> in the download store to <path>.
 
+    A copy sharing the data blocks of the file is made if the file system
+    supports reflinks, which can be modified independently.  Otherwise,
+    if <path> is to be <writable>, like a file installed for a package to
+    use, the file is copied, or else a hard link is made if possible, or a
+    symbolic link, to the read-only file.
+    """
 
-def get_url_filename(url):
-    """Obtain the file name from URL or None if not available."""
+    blob = get_store_blob(sha256)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    remove_file_or_dir(path)
 
-    info = urllib.request.urlopen(url).getheader('Content-Disposition')
-    if info is None:  # File name can be obtained from URL per se.
-        filename = os.path.basename(url)
-        if filename == '':
-            filename = None
-    else:  # File name may be obtained from 'Content-Disposition'.
-        _, params = cgi.parse_header(info)
-        if 'filename' in params:
-            filename = params['filename']
-        else:
-            filename = None
+    if reflink_file(blob, path) or writable:
+        if not os.path.exists(path):
+            shutil.copyfile(blob, path)
+        os.chmod(path, 0o644)
+        return
 
-    return filename
+    try:
+        os.link(blob, path)
+    except OSError:  # Different file systems or hard links not supported.
+        os.symlink(blob, path)
 
 
-def download_model_pkg(url, local, pkgfile, quiet):
-    """Download the model package mlm or zip file from <url> to <local>."""
+def clean_download_store():
+    """Remove the files in the download store which are not used by any model package.
 
-    if not quiet:
-        print("Package " + url + "\n")
+    A file is used if it is hard linked elsewhere, or symbolically linked
+    from the cache or archive dir of a model package.
 
-    meta = urllib.request.urlopen(url)
-    if meta.status != 200:
-        raise ModelURLAccessException(url)
+    Returns:
+        the number of files removed.
+    """
 
-    # Content-Length is not always necessarily available.
+    blobs_dir = os.path.join(STORE_DIR, 'sha256')
+    if not os.path.exists(blobs_dir):
+        return 0
 
-    dsize = meta.getheader("Content-Length")
-    if dsize is not None:
-        dsize = "{:,}".format(int(dsize))
+    used = set()
+    for top in (CACHE_DIR, ARCHIVE_DIR):
+        for path, dirs, files in os.walk(top):
+            for file in files:
+                file = os.path.join(path, file)
+                if os.path.islink(file):
+                    used.add(os.path.realpath(file))
 
-    if not quiet:
-        msg = "Downloading '{}'".format(pkgfile)
-        if dsize is not None:
-            msg += " ({} bytes)".format(dsize)
-        msg += " ...\n"
-        print(msg)
+    removed = set()
+    for path, dirs, files in os.walk(blobs_dir):
+        for file in files:
+            blob = os.path.join(path, file)
+            if os.stat(blob).st_nlink == 1 and os.path.realpath(blob) not in used:
+                os.remove(blob)
+                removed.add(file)
 
-    # Download the archive from the URL.
+    # Remove the records of the files removed.
 
-    try:
-        urllib.request.urlretrieve(url, local)
-    except urllib.error.URLError as error:
-        raise ModelDownloadHaltException(url, error.reason.lower())
+    records_dir = os.path.join(STORE_DIR, 'url')
+    if removed and os.path.exists(records_dir):
+        for file in os.listdir(records_dir):
+            record = os.path.join(records_dir, file)
+            try:
+                with open(record) as f:
+                    if json.load(f)['sha256'] not in removed:
+                        continue
+            except (OSError, ValueError, KeyError, TypeError):
+                pass
+            os.remove(record)
+
+    return len(removed)
 
 
 # ----------------------------------------------------------------------
@@ -431,7 +2313,7 @@ def _create_dir(path, error_msg, exception):
     return path
 
 
-def unpack_with_promote(file, dest, valid_name=None, remove_dst=True):
+def unpack_with_promote(file, dest, valid_name=None, remove_dst=True, select=None):
     """Unzip <file> into the directory <dest>.
 
     If all files in the zip file are under a top level directory,
@@ -440,6 +2322,9 @@ def unpack_with_promote(file, dest, valid_name=None, remove_dst=True):
     If <remove_dst> is True, then the directory <dest> will be remove first,
     otherwise, unextracted files will co-exist with those already in <dest>.
 
+    If <select> is given, only the files for whose path, relative to the
+    top level dir if promoted, it returns True are extracted.
+
     Return whether promotion happend and the top level dir if did.
     """
 
@@ -456,9 +2341,9 @@ def unpack_with_promote(file, dest, valid_name=None, remove_dst=True):
         valid_name = file
 
     if is_mlm_zip(valid_name):
-        opener, lister_name, appender_name = zipfile.ZipFile, 'namelist', 'write'
+        opener, lister_name = zipfile.ZipFile, 'namelist'
     else:
-        opener, lister_name, appender_name = tarfile.open, 'getnames', 'add'
+        opener, lister_name = tarfile.open, 'getnames'
 
     # Unpack <file>.
 
@@ -477,50 +2362,70 @@ def unpack_with_promote(file, dest, valid_name=None, remove_dst=True):
         if not promote:  # All files are at the top level.
 
             logger.debug("Extract {} directly into {}".format(file, dest))
-            pkg_file.extractall(dest)
+            if select is None:
+                members = pkg_file.infolist() if opener is zipfile.ZipFile else pkg_file.getmembers()
+            elif opener is zipfile.ZipFile:
+                members = [x for x in pkg_file.infolist() if select(x.filename.rstrip('/'))]
+                file_list = [x.filename for x in members]
+            else:
+                members = [x for x in pkg_file.getmembers() if select(x.name)]
+                file_list = [x.name for x in members]
+
+            if opener is zipfile.ZipFile:
+                extract_zip_members(file, members, dest)
+            else:
+                pkg_file.extractall(dest, members)
             return False, top_dir, file_list
 
         else:  # All files are under a top dir.
             logger.debug("Extract {} without top dir into {}".format(file, dest))
-            file_list = []
-            with tempfile.TemporaryDirectory() as tmpdir:
-
-                # Extract file.
-
-                pkg_file.extractall(tmpdir)
-
-                with tempfile.TemporaryDirectory() as tmpdir2:
 
-                    # Repack files without top dir and then extract again into <dest>.
-                    #
-                    # Extraction can be done on a existing dir, without removing the dir first,
-                    # and the extracted files can co-exist with the files already inside the dir,
-                    # without affecting the existing files except they have the same name.
+            # Extract the members straight into <dest> in one pass, with the top dir
+            # removed from their paths.
+            #
+            # Extraction can be done on a existing dir, without removing the dir first,
+            # and the extracted files can co-exist with the files already inside the dir,
+            # without affecting the existing files except they have the same name.
 
-                    with opener(os.path.join(tmpdir2, 'tmpball'), 'w') as new_pkg_file:
-                        appender = getattr(new_pkg_file, appender_name)
-                        dir_path = os.path.join(tmpdir, top_dir)
-                        for path, dirs, files in os.walk(dir_path):
-                            for file in files:
-                                file_path = os.path.join(path, file)
-                                arc_path = os.path.relpath(file_path, dir_path)
-                                file_list.append(arc_path)
-                                appender(file_path, arc_path)
-
-                    with opener(os.path.join(tmpdir2, 'tmpball')) as new_pkg_file:
-                        new_pkg_file.extractall(dest)
+            file_list = []
+            prefix = top_dir + '/'
+            if opener is zipfile.ZipFile:
+                members = []
+                for info in pkg_file.infolist():
+                    if not info.filename.startswith(prefix) or info.filename == prefix:
+                        continue
+                    if select is not None and not select(info.filename[len(prefix):].rstrip('/')):
+                        continue
+                    info = copy.copy(info)  # The member is read by its original name.
+                    info.filename = info.filename[len(prefix):]
+                    members.append(info)
+                    if not info.is_dir():
+                        file_list.append(info.filename)
+                extract_zip_members(file, members, dest)
+            else:
+                for member in pkg_file.getmembers():
+                    if not member.name.startswith(prefix):
+                        continue
+                    if select is not None and not select(member.name[len(prefix):]):
+                        continue
+                    member = copy.copy(member)
+                    member.name = member.name[len(prefix):]
+                    if member.islnk() and member.linkname.startswith(prefix):  # Hard link to a member
+                        member.linkname = member.linkname[len(prefix):]
+                    pkg_file.extract(member, dest)
+                    if not member.isdir():
+                        file_list.append(member.name)
 
             return True, top_dir, file_list
 
 
 def remove_file_or_dir(path):
-    """Remove an existing file or directory."""
+    """Remove an existing file or directory, or a symbolic link even if dangling."""
 
-    if os.path.exists(path):
-        if os.path.isfile(path):
-            os.remove(path)
-        else:
-            shutil.rmtree(path)
+    if os.path.islink(path) or os.path.isfile(path):
+        os.unlink(path)
+    elif os.path.lexists(path):
+        shutil.rmtree(path)
 
 
 def make_symlink(src, dst):
@@ -531,19 +2436,207 @@ def make_symlink(src, dst):
     os.symlink(src, dst)
 
 
+def reflink_file(src, dst):
+    """Copy the file <src> to <dst> sharing its data blocks, if the file system supports reflinks.
+
+    The copy is made by the FICLONE ioctl on Linux, which is instant on
+    Btrfs or XFS.
+
+    Returns:
+        whether the copy is made.
+    """
+
+    if not sys.platform.startswith('linux') or os.path.islink(src):
+        return False
+
+    import fcntl
+
+    try:
+        with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+            fcntl.ioctl(fdst.fileno(), 0x40049409, fsrc.fileno())  # FICLONE
+    except OSError:  # Not supported by the file system or across file systems.
+        if os.path.exists(dst):
+            os.remove(dst)
+        return False
+
+    return True
+
+
+def clone_file(src, dst):
+    """Copy the file <src> to <dst>, sharing its data blocks if the file system supports reflinks.
+
+    Used where a copy cannot be avoided, like moving across file systems,
+    the copy is made by reflink_file, otherwise by shutil.copy2.
+    """
+
+    if reflink_file(src, dst):
+        shutil.copystat(src, dst)
+        return dst
+
+    return shutil.copy2(src, dst)
+
+
+def write_file(path, content):
+    """Write <content>, as bytes, into <path> atomically.
+
+    The content is written into a temporary file of its own, then renamed
+    to <path>, thus threads or processes writing the same file at the
+    same time never mix their writes, and readers see a complete file.
+    """
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with tempfile.NamedTemporaryFile('wb', dir=os.path.dirname(path), prefix=os.path.basename(path) + '.',
+                                     suffix='.tmp', delete=False) as file:
+        file.write(content)
+    os.replace(file.name, path)
+
+
+def write_json_file(path, data):
+    """Write <data> as JSON into <path> atomically, as write_file."""
+
+    write_file(path, json.dumps(data).encode('utf-8'))
+
+
+def move_file_or_dir(src, dst):
+    """Move the file or directory <src> to <dst> as shutil.move.
+
+    It is a rename on the same file system, like from the scratch dir
+    into MLINIT, otherwise files are copied by clone_file.
+    """
+
+    return shutil.move(src, dst, copy_function=clone_file)
+
+
 def merge_folder(src_dir, dst_dir):
     """Move files from src_dir into dst_dir without removing existing files under dst_dir."""
 
-    file_list = []
-    for path, dirs, files in os.walk(src_dir):
-        for file in files:
-            src = os.path.join(path, file)
-            dst = os.path.join(dst_dir, os.path.relpath(src, src_dir))
-            os.makedirs(os.path.dirname(dst), exist_ok=True)
-            shutil.move(src, dst)
-            file_list.append(os.path.relpath(src, src_dir))
+    file_list = []
+    for path, dirs, files in os.walk(src_dir):
+        for file in files:
+            src = os.path.join(path, file)
+            dst = os.path.join(dst_dir, os.path.relpath(src, src_dir))
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            move_file_or_dir(src, dst)
+            file_list.append(os.path.relpath(src, src_dir))
+
+    return file_list
+
+
+def extract_zip_members(file, members, dest, workers=EXTRACT_WORKERS):
+    """Extract the <members> of the zip <file> into <dest>, up to <workers> of them at the same time.
+
+    Zip members are compressed independently, thus are inflated
+    concurrently, each worker thread reading <file> by its own handle.
+    The directories are created first, so that the workers only write
+    files, the largest first.  As ZipFile.extract, the paths are kept
+    inside <dest>, and an existing file is replaced.
+
+    Args:
+        file (str): path of the zip file.
+        members (list): ZipInfo of the members, whose filename is the path
+                        to extract to, relative to <dest>, which may differ
+                        from the name it is read by, its orig_filename.
+        dest (str): directory to extract into.
+        workers (int): maximum number of members extracted at the same time.
+    """
+
+    files = []
+    dirs = {dest}
+    for info in members:
+        arcname = os.path.splitdrive(info.filename.replace('/', os.path.sep))[1]
+        arcname = os.path.sep.join(x for x in arcname.split(os.path.sep) if x not in ('', os.path.curdir, os.path.pardir))
+        target = os.path.join(dest, arcname)
+        if info.is_dir():
+            dirs.add(target)
+        elif arcname:
+            dirs.add(os.path.dirname(target))
+            files.append((info, target))
+
+    for path in sorted(dirs):
+        os.makedirs(path, exist_ok=True)
+
+    handles = []
+    local = threading.local()
+
+    def extract(member):
+        info, target = member
+        if not hasattr(local, 'handle'):
+            local.handle = zipfile.ZipFile(file)
+            handles.append(local.handle)
+        if os.path.islink(target) or os.path.isfile(target):  # It may be linked to the download store.
+            os.remove(target)
+        with local.handle.open(info) as src, open(target, 'wb') as dst:
+            shutil.copyfileobj(src, dst, 1024 * 1024)
+
+    files.sort(key=lambda member: member[0].file_size, reverse=True)
+    try:
+        if workers <= 1 or len(files) <= 1:
+            for member in files:
+                extract(member)
+        else:
+            with concurrent.futures.ThreadPoolExecutor(min(workers, len(files))) as executor:
+                for _ in executor.map(extract, files):
+                    pass
+    finally:
+        for handle in handles:
+            handle.close()
+
+
+class ZipIndex(object):
+    """A zip file, like a GitHub repo archive, whose members are read once and indexed by name.
+
+    The files under a directory are extracted without extracting the
+    others, relative to the top level dir if all the files are under one.
+    """
+
+    def __init__(self, file):
+        self.file = file
+        with zipfile.ZipFile(file) as zip_file:
+            self.infos = {info.filename: info for info in zip_file.infolist() if not info.is_dir()}
+        self.names = sorted(self.infos)
+
+        tops = {name.split('/')[0] for name in self.names}
+        self.top_dir = tops.pop() if len(tops) == 1 and all('/' in name for name in self.names) else None
+
+    def extract_dir(self, path, dest):
+        """Extract the files under the directory <path> of the zip file into <dest>.
+
+        Returns:
+            list: the paths of the files extracted relative to <dest>.
+        """
+
+        prefix = '/'.join(x for x in (self.top_dir, path.strip('/')) if x)
+        prefix = prefix + '/' if prefix else ''
+
+        members = []
+        for name in self.names[bisect.bisect_left(self.names, prefix):]:
+            if not name.startswith(prefix):
+                break
+
+            # Skip the files which would be extracted out of <dest>, as ZipFile.extract does.
+
+            arc_path = os.path.normpath(name[len(prefix):])
+            if os.path.isabs(arc_path) or arc_path.split(os.path.sep)[0] == '..':
+                continue
+
+            info = copy.copy(self.infos[name])
+            info.filename = arc_path
+            members.append(info)
+
+        extract_zip_members(self.file, members, dest)
+
+        return [info.filename for info in members]
+
+
+def get_file_sha256(path):
+    """Return the sha256 hex digest of the file <path>."""
+
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b''):
+            digest.update(chunk)
 
-    return file_list
+    return digest.hexdigest()
 
 
 def dir_size(dirpath):
@@ -767,6 +2860,9 @@ def flatten_mlhubyaml_deps(deps, cats=None, res=None):
           - https://github.com/mlhubber/colorize/raw/master/jsgifd_2018.png: images/cat.png
           - https://github.com/mlhubber/colorize/archive/master.zip: res/
           - https://github.com/mlhubber/colorize/archive/arcdfikdf_12.zip: res/xyz.zip
+          - https://github.com/mlhubber/colorize/raw/master/model.RData: data/  # With the expected
+            sha256: 9f86d081884c7d659a2feaa0c55ad015a3bf4f1b2b0b822cd15d6c15b0f00a08  # sha256 and/or size
+            size: 1024
 
     Then the input argument <deps> is a dict loaded by yaml from the dependency specification above:
 
@@ -778,7 +2874,10 @@ def flatten_mlhubyaml_deps(deps, cats=None, res=None):
                  {'https://github.com/mlhubber/colorize/raw/master/train.data': 'data/'},
                  {'https://github.com/mlhubber/colorize/raw/master/jsgifd_2018.png': 'images/cat.png'},
                  {'https://github.com/mlhubber/colorize/archive/master.zip': 'res/'},
-                 {'https://github.com/mlhubber/colorize/archive/arcdfikdf_12.zip': 'res/xyz.zip'}]
+                 {'https://github.com/mlhubber/colorize/archive/arcdfikdf_12.zip': 'res/xyz.zip'},
+                 {'https://github.com/mlhubber/colorize/raw/master/model.RData': 'data/',
+                  'sha256': '9f86d081884c7d659a2feaa0c55ad015a3bf4f1b2b0b822cd15d6c15b0f00a08',
+                  'size': 1024}]
       }
 
     And the result returned is something like:
@@ -792,7 +2891,11 @@ def flatten_mlhubyaml_deps(deps, cats=None, res=None):
                     'https://github.com/mlhubber/colorize/raw/master/train.data': 'data/',
                     'https://github.com/mlhubber/colorize/raw/master/jsgifd_2018.png': 'images/cat.png',
                     'https://github.com/mlhubber/colorize/archive/master.zip': 'res/',
-                    'https://github.com/mlhubber/colorize/archive/arcdfikdf_12.zip': 'res/xyz.zip'}]
+                    'https://github.com/mlhubber/colorize/archive/arcdfikdf_12.zip': 'res/xyz.zip',
+                    'https://github.com/mlhubber/colorize/raw/master/model.RData': {
+                        'target': 'data/',
+                        'sha256': '9f86d081884c7d659a2feaa0c55ad015a3bf4f1b2b0b822cd15d6c15b0f00a08',
+                        'size': 1024}}]
       ]
     """
 
@@ -805,7 +2908,10 @@ def flatten_mlhubyaml_deps(deps, cats=None, res=None):
             if isinstance(dep, str):
                 results[dep] = None
             else:
-                results.update(dep)
+                dep = dict(dep)
+                checksum = {k: dep.pop(k) for k in ('sha256', 'size') if k in dep}
+                for location, target in dep.items():
+                    results[location] = dict(checksum, target=target) if checksum else target
         return results
 
     if res is None:
@@ -881,7 +2987,7 @@ def install_python_deps(deps, model, source='pip', yes=False):
             category = "file"
             deps = first_dep[list(first_dep)[0]]
             with open(deps, 'r') as file:
-                name = yaml.load(file, Loader=yaml.SafeLoader)['name']
+                name = yaml.load(file, Loader=YAMLLoader)['name']
             update_conda_env_name(model, name)
         elif list(first_dep)[0] == "name":  # For environment name, store for later use
             update_conda_env_name(model, first_dep[list(first_dep)[0]])
@@ -921,9 +3027,61 @@ def install_system_deps(deps, yes=False):
         raise ConfigureFailedException()
 
 
-def install_file_deps(deps, model, downloadir=None, yes=False):
+def get_file_spec(entry):
+    """Return the files spec of the MLHUB.yaml <entry> as {'files': [...]}, or None if not specified."""
+
+    depspec = None
+    if 'dependencies' in entry:
+        depspec = entry['dependencies']
+    elif 'dependencies' in entry['meta']:
+        depspec = entry['meta']['dependencies']
+
+    file_spec = None
+    if depspec is not None and 'files' in depspec:
+        file_spec = {'files': depspec['files']}
+    elif 'files' in entry:
+        file_spec = {'files': entry['files']}
+
+    return file_spec
+
+
+def select_package_files(deps):
+    """Return a function to check if a file of a package archive is installed by the file <deps>.
+
+    The function tells whether the file at the path, relative to the
+    package root, is one of the package files in <deps>, or under one of
+    the dirs, thus only those need to be extracted from the archive.  See
+    install_file_deps for <deps>.
+    """
+
+    prefixes = []
+    for location in deps:
+        if is_url(location) or is_github_ref(location):
+            continue
+        if location.endswith('*'):  # All files under a dir
+            location = location[:-1]
+        location = posixpath.normpath(location.replace(os.path.sep, '/'))
+        prefixes.append('' if location == '.' else location)
+
+    def select(path):
+        path = posixpath.normpath(path)
+        return any(p == '' or path == p or path.startswith(p + '/') for p in prefixes)
+
+    return select
+
+
+def install_file_deps(deps, model, downloadir=None, yes=False,
+                      workers=DOWNLOAD_WORKERS, host_workers=DOWNLOAD_HOST_WORKERS, segments=DOWNLOAD_SEGMENTS,
+                      pkg_dir=None):
     """Install file dependencies.
 
+    The files are installed into <pkg_dir>, by default the package dir of
+    <model>, which is the version dir being built during installation.
+
+    The files at URLs are resolved and downloaded concurrently by up to
+    <workers> threads, at most <host_workers> of them from the same host.
+    A large file is itself downloaded in up to <segments> concurrently.
+
     For example, if MLHUB.yaml is
     
       files:
@@ -937,6 +3095,9 @@ def install_file_deps(deps, model, downloadir=None, yes=False):
                                                      #      be unzipped into res/path/to/xxx
         - https://zzz.org/z.zip:     ./              # URL: The same as above
         - https://zzz.org/uvw.zip:   res/rst.zip     # URL: Download to res/rst.zip
+        - https://zzz.org/big.RData: data/           # URL: Download to data/ and check its sha256 and/or size
+          sha256: 9f86d081884c7d659a2feaa0c55ad015a3bf4f1b2b0b822cd15d6c15b0f00a08
+          size: 1024
 
         - description/README.md                        # Move to package root dir
         - res/tree.RData:            resource/         # Move to resource/
@@ -961,6 +3122,9 @@ def install_file_deps(deps, model, downloadir=None, yes=False):
         'https://zzz.org/xyz.zip':   'res/',
         'https://zzz.org/z.zip':     './',
         'https://zzz.org/uvw.zip':   'res/rst.zip',
+        'https://zzz.org/big.RData': {'target': 'data/',
+                                      'sha256': '9f86d081884c7d659a2feaa0c55ad015a3bf4f1b2b0b822cd15d6c15b0f00a08',
+                                      'size': 1024},
 
         'description/README.md':     None,
         'res/tree.RData':            'resource/',
@@ -1052,39 +3216,151 @@ def install_file_deps(deps, model, downloadir=None, yes=False):
 
     cache_dir = create_package_cache_dir(model)
     archive_dir = create_package_archive_dir(model)
-    pkg_dir = get_package_dir(model)
+    if pkg_dir is None:
+        pkg_dir = get_package_dir(model)
 
     logger = logging.getLogger(__name__)
     logger.info("Install file dependencies.")
     logger.debug("deps: {}".format(deps))
 
-    if downloadir is None:
+    # Deal with URL and path differently.
+    #
+    # If <location> is a path, it is a package file should be installed during `ml install`,
+    # elif <location> is a URL, it is a file downloaded during `ml configure`.
+
+    if downloadir is None:  # URL for non-package files
         print("\n*** Downloading required files ...")
 
-    for location, target in deps.items():
+        # Resolve and download the files concurrently, while installing them in order as
+        # soon as they are available.
+
+        locations = []
+        for location, target in deps.items():
+            if is_url(location) or is_github_ref(location):
+                checksum = None
+                if isinstance(target, dict):  # With the expected checksum
+                    checksum = {k: target[k] for k in ('sha256', 'size') if k in target}
+                    target = target['target']
+                locations.append((location, target, checksum))
+
+        limiter = HostLimiter(host_workers)
+        url_locks = {}
+        archives = {}  # Indexes of the GitHub archives shared by the deps on the same repo and ref
+
+        with concurrent.futures.ThreadPoolExecutor(workers) as executor:
+            futures = [executor.submit(_download_file_dep, location, target, cache_dir, archive_dir, limiter,
+                                       url_locks, segments, checksum)
+                       for location, target, checksum in locations]
+            try:
+                for future in futures:
+                    _install_file_dep(future.result(), pkg_dir, archives)
+            except BaseException:
+                for future in futures:
+                    future.cancel()
+                raise
+
+    else:  # Path for package files
+
+        for location, target in deps.items():
+            if is_url(location) or is_github_ref(location):
+                continue
+
+            if isinstance(target, dict):  # With the expected checksum which is only checked for URL.
+                target = target['target']
+
+            # Move the files from download dir to package dir.
+
+            try:
+                goal = os.path.join(pkg_dir, '' if target is None else target)
+                if location.endswith('*'):  # Move all files under <location> to package's root dir
+                    origin = os.path.join(downloadir, location[:-2])
+                    merge_folder(origin, goal)
+                else:
+                    origin = os.path.join(downloadir, location)
+                    if os.path.isdir(origin) and not goal.endswith(os.path.sep):
+                        merge_folder(origin, goal)
+                    else:
+                        os.makedirs(os.path.dirname(goal), exist_ok=True)
+                        move_file_or_dir(origin, goal)
+            except FileNotFoundError:
+                raise ModePkgInstallationFileNotFoundException(location)
+
+
+def _download_file_dep(location, target, cache_dir, archive_dir, limiter, url_locks, segments, checksum=None):
+    """Download the file dependency at <location> into the cache dir of the package.
 
-        # Deal with URL and path differently.
-        #
-        # If <location> is a path, it is a package file should be installed during `ml install`,
-        # elif <location> is a URL, it is a file downloaded during `ml configure`.
+    The file is downloaded into the download store, shared by all the
+    packages, and linked into Cache dir, then symbolically linked into
+    Package dir, thus we can reuse the downloaded files after model package
+    upgrade.  The file name is obtained from the same request as the file,
+    or from the download store without any request.  <url_locks> is the
+    dict of the locks of the URLs being downloaded.
 
-        if downloadir is None and (is_url(location) or is_github_ref(location)):  # URL for non-package files
+    Returns:
+        dict of the 'location' of the file, its 'filetype', 'path' in the
+        repo, 'target' under the package dir, 'cache' and 'archive' paths,
+        whether it needs to be unzipped, 'unzip', and whether the cached
+        copy is reused, 'reuse'.
+    """
+
+    logger = logging.getLogger(__name__)
+    logger.debug("Download file from URL: {}".format(location))
+
+    # Determine file name, type, real location and path
+
+    filetype = 'file'  # The type of the item to be download: file, repo, dir
+    path = None        # The path of the item in the repo
+    repo = None        # The name of the repo if it is a GitHub repo otherwise None
+    foldername = None
+
+    if is_github_ref(location):
+        with limiter(location):
+            filetype, location, repo, path = get_github_type(location)
+
+    # Deps on the same file, like directories of the same GitHub repo, download it once,
+    # the others waiting to find it in the download store.
 
-            # Download file into Cache dir, then symbolically link it into Package dir.
-            # Thus we can reuse the downloaded files after model package upgrade.
+    with url_locks.setdefault(location, threading.Lock()):
 
-            # Determine file name, type, real location and path
+        # The file in the download store is only used if it has the expected sha256 if any.
 
-            logger.debug("Download file from URL: {}".format(location))
-            filetype = 'file'  # The type of the item to be download: file, repo, dir
-            path = None        # The path of the item in the repo
-            repo = None        # The name of the repo if it is a GitHub repo otherwise None
-            foldername = None
+        sha256 = None if checksum is None or 'sha256' not in checksum else str(checksum['sha256']).lower()
+        response = None
+        modified = False
+        record = read_store_url(location)
+        if record is not None and sha256 is not None and record['sha256'] != sha256:
+            record = None
+        try:
 
-            if is_github_ref(location):
-                filetype, location, repo, path = get_github_type(location)
+            # The file at a URL may change, unless its sha256 is expected or the URL refers to a
+            # commit, thus the file downloaded before is only used if not modified since.
+
+            if record is not None and sha256 is None and not is_immutable_url(location):
+                headers = {}
+                if record.get('etag') is not None:
+                    headers['If-None-Match'] = record['etag']
+                if record.get('last_modified') is not None:
+                    headers['If-Modified-Since'] = record['last_modified']
+                with limiter(location):
+                    try:
+                        response = open_url(location, headers)
+                        record = None  # Modified, thus downloaded again.
+                        modified = True
+                    except urllib.error.HTTPError as error:
+                        if error.code != 304:
+                            raise ModelPkgDependencyFileNotFoundException(location)
+
+            if record is not None:
+                filename = record['filename']
+            else:
+                if response is None:
+                    with limiter(location):
+                        try:
+                            response = open_url(location)
+                        except urllib.error.HTTPError:
+                            raise ModelPkgDependencyFileNotFoundException(location)
 
-            filename = get_url_filename(location)  # The name of the file to be downloaded
+                filename = get_response_filename(location, response)  # The name of the file to be downloaded
 
             if filename is None:
 
@@ -1134,74 +3410,80 @@ def install_file_deps(deps, model, downloadir=None, yes=False):
             if needUnzip:
                 archive = os.path.join(archive_dir, target, filename)  # unzip file if target is a dir
 
-            # Download file
+            # 20190327 gjw for now cache management is behind
+            # scenes and do not need to ask for each one. If
+            # already in cache then don't download. If user wants
+            # to download then maybe have a --force or simply
+            # REMOVE and INSTALL the model again, or delete the
+            # downloaded file manually.
 
-            download_msg = "\n    * {}"
-            print(download_msg.format(location))
+            # Partial downloads are kept as .part files, thus are never reused but resumed,
+            # while a cached file is only reused if it matches the expected checksum if any,
+            # and replaced if the file at the URL has been modified since downloaded.
 
-            reuse = False
-            download_msg = "      downloading into {} ..."
-        
-            if os.path.exists(archive):
+            reuse = (not modified and os.path.exists(archive)
+                     and (checksum is None or is_file_checksum(archive, checksum)))
+            if not reuse:
+                if record is not None:  # Downloaded by another package.
+                    reuse = True
+                elif sha256 is not None and has_store_blob(sha256):  # The same content downloaded.
+                    record = write_store_url(location, sha256, filename)
+                    reuse = True
+                else:
+                    # Each segment of the file is a request to the host, thus the file is
+                    # split into no more segments than the requests to the host free.
 
-                # 20190327 gjw for now cache management is behind
-                # scenes and do not need to ask for each one. If
-                # already in cache then don't download. If user wants
-                # to download then maybe have a --force or simply
-                # REMOVE and INSTALL the model again, or delete the
-                # downloaded file manually.
+                    with limiter(location):
+                        extra = limiter.acquire_free(location, segments - 1)
+                        try:
+                            record = store_download(location, filename, response, 1 + extra, checksum)
+                        finally:
+                            limiter.release(location, extra)
+                    response = None
+                link_store_blob(record['sha256'], archive, writable=not needUnzip)
 
-                download_msg = "      using cached copy found in {} ..."
-                reuse = True
+        finally:
+            if response is not None:
+                response.close()
 
-            print(download_msg.format(os.path.join(pkg_dir, target)))
+    return {'location': location, 'filetype': filetype, 'path': path, 'target': target,
+            'cache': cache, 'archive': archive, 'unzip': needUnzip, 'reuse': reuse}
 
-            if not reuse:
-                os.makedirs(os.path.dirname(archive), exist_ok=True)
 
-                try:
-                    urllib.request.urlretrieve(location, archive)
-                except urllib.error.HTTPError:
-                    raise ModelPkgDependencyFileNotFoundException(location)
-
-            # Install: unzip if necessary and make symbolic links
-
-            src = cache
-            dst = os.path.join(pkg_dir, target)
-            symlinks = [(src, dst)]
-            if needUnzip:  # Uncompress archive file
-                print("      Uncompressing the cached file {} ...".format(archive))
-                file_list = []
-                if filetype != 'dir':
-                    _, _, file_list = unpack_with_promote(archive, cache, remove_dst=False)
-                else:
-                    with tempfile.TemporaryDirectory() as tmpdir:
-                        unpack_with_promote(archive, tmpdir, remove_dst=False)
-                        file_list = merge_folder(os.path.join(tmpdir, path, ''), cache)
+def _install_file_dep(dep, pkg_dir, archives):
+    """Install the file dependency <dep> downloaded by _download_file_dep into <pkg_dir>.
 
-                symlinks = [(os.path.join(src, file), os.path.join(dst, file)) for file in file_list]
+    Unzip the file if necessary and make symbolic links in Package dir.  The
+    archive of a GitHub repo or dir is indexed once into <archives>, by its
+    location, for all the deps on it and only the files needed extracted.
+    """
 
-            for origin, goal in symlinks:
-                make_symlink(origin, goal)
+    print("\n    * {}".format(dep['location']))
 
-        elif downloadir is not None and not (is_url(location) or is_github_ref(location)):  # Path for package files
+    if dep['reuse']:
+        download_msg = "      using cached copy found in {} ..."
+    else:
+        download_msg = "      downloaded into {} ..."
+    print(download_msg.format(os.path.join(pkg_dir, dep['target'])))
+
+    # Install: unzip if necessary and make symbolic links
+
+    src = dep['cache']
+    dst = os.path.join(pkg_dir, dep['target'])
+    symlinks = [(src, dst)]
+    if dep['unzip']:  # Uncompress archive file
+        print("      Uncompressing the cached file {} ...".format(dep['archive']))
+        if dep['filetype'] == 'file':
+            _, _, file_list = unpack_with_promote(dep['archive'], dep['cache'], remove_dst=False)
+        else:
+            if dep['location'] not in archives:
+                archives[dep['location']] = ZipIndex(dep['archive'])
+            file_list = archives[dep['location']].extract_dir(dep['path'] or '', dep['cache'])
 
-            # Move the files from download dir to package dir.
+        symlinks = [(os.path.join(src, file), os.path.join(dst, file)) for file in file_list]
 
-            try:
-                goal = os.path.join(pkg_dir, '' if target is None else target)
-                if location.endswith('*'):  # Move all files under <location> to package's root dir
-                    origin = os.path.join(downloadir, location[:-2])
-                    merge_folder(origin, goal)
-                else:
-                    origin = os.path.join(downloadir, location)
-                    if os.path.isdir(origin) and not goal.endswith(os.path.sep):
-                        merge_folder(origin, goal)
-                    else:
-                        os.makedirs(os.path.dirname(goal), exist_ok=True)
-                        shutil.move(origin, goal)
-            except FileNotFoundError:
-                raise ModePkgInstallationFileNotFoundException(location)
+    for origin, goal in symlinks:
+        make_symlink(origin, goal)
 
 
 # ----------------------------------------------------------------------
@@ -1342,6 +3624,138 @@ def compose_github_content_url(owner, repo, ref, path, api=False):
     return url
 
 
+def _get_github_cache_file(url):
+    """Return the path of the cached response of the GitHub REST API at <url>.
+
+    Responses are cached by owner, repo, ref and path for the contents API.
+    """
+
+    match = re.match(r'https://api\.github\.com/repos/([^/]+)/([^/]+)/contents/([^?]*)(?:\?ref=(.*))?$', url)
+    if match is None:
+        return os.path.join(GITHUB_CACHE_DIR, hashlib.sha256(url.encode('utf-8')).hexdigest() + '.json')
+
+    owner, repo, path, ref = match.groups()
+    key = '{}:{}'.format(ref or '', path)
+    return os.path.join(GITHUB_CACHE_DIR, owner, repo, hashlib.sha256(key.encode('utf-8')).hexdigest() + '.json')
+
+
+def _read_github_api(url, accept=None):
+    """Return the response of the GitHub REST API at <url> in the media type <accept>.
+
+    The response is cached on disk along with its ETag and Last-Modified,
+    which are sent to ask if it has been modified since, and the cached
+    one is used if not.  The response for a commit is used without asking,
+    and a cached response is also used, if any, when the API cannot be
+    reached or its rate limit is exceeded.
+
+    See https://developer.github.com/v3/#conditional-requests
+    """
+
+    logger = logging.getLogger(__name__)
+
+    headers = {} if accept is None else {'Accept': accept}
+    key = _get_cache_key('GET', url, headers)
+    content = _get_cached_response(key)
+    if content is not None:
+        return content
+
+    path = _get_github_cache_file(url if accept is None else url + ' ' + accept)
+    try:
+        with open(path) as file:
+            previous = json.load(file)
+    except (OSError, ValueError):
+        previous = None
+
+    ref = urllib.parse.parse_qs(urllib.parse.urlsplit(url).query).get('ref', [''])[0]
+    if previous is not None and _is_github_commit(ref):
+        content = previous['content'].encode('utf-8')
+        _cache_response(key, content)
+        return content
+
+    if previous is not None:
+        headers = dict(headers)
+        if previous.get('etag') is not None:
+            headers['If-None-Match'] = previous['etag']
+        if previous.get('last_modified') is not None:
+            headers['If-Modified-Since'] = previous['last_modified']
+
+    try:
+        with open_url(url, headers) as response:
+            content = response.read()
+            etag = response.getheader('ETag')
+            last_modified = response.getheader('Last-Modified')
+    except urllib.error.HTTPError as error:
+        limited = error.code == 429 or (error.code == 403 and error.headers.get('X-RateLimit-Remaining') == '0')
+        if previous is None or (error.code != 304 and not limited):
+            raise
+        if limited:
+            logger.warning("GitHub API rate limit exceeded, using the cached response of {}.".format(url))
+        content = previous['content'].encode('utf-8')
+    except urllib.error.URLError:
+        if previous is None:
+            raise
+        logger.warning("GitHub API not reachable, using the cached response of {}.".format(url))
+        content = previous['content'].encode('utf-8')
+    else:
+        write_json_file(path, {'url': url,
+                               'etag': etag,
+                               'last_modified': last_modified,
+                               'content': content.decode('utf-8')})
+
+    _cache_response(key, content)
+
+    return content
+
+
+def read_github_api(url):
+    """Return the decoded JSON response of the GitHub REST API at <url>, see _read_github_api."""
+
+    return json.loads(_read_github_api(url))
+
+
+def resolve_github_ref(owner, repo, ref):
+    """Return the SHA of the commit which <ref> of the GitHub repo <owner>/<repo> refers to.
+
+    A branch, tag or short SHA is resolved once per invocation, asking the
+    API if it has changed since it was last resolved.  If it cannot be
+    resolved, <ref> itself is returned.
+
+    See https://developer.github.com/v3/repos/commits/#get-a-single-commit
+    """
+
+    if _is_github_commit(ref):
+        return ref
+
+    logger = logging.getLogger(__name__)
+
+    url = "https://api.github.com/repos/{}/{}/commits/{}".format(owner, repo, ref)
+    try:
+        sha = _read_github_api(url, accept='application/vnd.github.sha').decode('utf-8').strip()
+    except (urllib.error.URLError, OSError, http.client.HTTPException, UnicodeDecodeError) as error:
+        logger.warning("Cannot resolve '{}' of {}/{} to a commit: {}".format(ref, owner, repo, error))
+        return ref
+
+    if not _is_github_commit(sha):
+        return ref
+
+    logger.debug("{}/{}@{} is commit {}".format(owner, repo, ref, sha))
+
+    return sha
+
+
+def is_github_commit_archive(url):
+    """Check if <url> is the zip archive of a GitHub commit, which never changes."""
+
+    return re.fullmatch(r'https://codeload\.github\.com/[^/]+/[^/]+/zip/[0-9a-f]{40}', url) is not None
+
+
+def is_immutable_url(url):
+    """Check if the content at <url> never changes, like the archive or a file of a GitHub commit."""
+
+    return is_github_commit_archive(url) or \
+        re.fullmatch(r'https://raw\.githubusercontent\.com/[^/]+/[^/]+/[0-9a-f]{40}/.+', url) is not None
+
+
 def get_githubrepo_zip_url(url):
     """Get the GitHub zip file url of model package.
 
@@ -1349,16 +3763,21 @@ def get_githubrepo_zip_url(url):
     """
 
     owner, repo, ref, _ = interpret_github_url(url)
-    return compose_github_repo_zip_url(owner, repo, ref)
+    return compose_github_repo_zip_url(owner, repo, resolve_github_ref(owner, repo, ref))
 
 
-def get_pkgyaml_github_url(url):
+def get_pkgyaml_github_url(url, resolve=True):
     """Get the GitHub url of DESCRIPTION.yaml file of model package.
 
+    The URL refers to the commit the ref of <url> is resolved to, the same
+    as the archive of the package, unless <resolve> is False.
+
     See https://developer.github.com/v3/repos/contents/#get-contents
     """
 
     owner, repo, ref, mlhubyaml = interpret_github_url(url)
+    if resolve:
+        ref = resolve_github_ref(owner, repo, ref)
     url = compose_github_content_url(owner, repo, ref, '{}')
     if mlhubyaml is None:
         return get_available_pkgyaml(url)
@@ -1370,12 +3789,13 @@ def get_github_type(location):
     """Query if location is a file or directory or a repo on GitHub."""
 
     owner, repo, ref, path = interpret_github_url(location)
+    ref = resolve_github_ref(owner, repo, ref)
     if path is None:
         url = compose_github_repo_zip_url(owner, repo, ref)
         return 'repo', url, repo, path
     else:
         url = compose_github_content_url(owner, repo, ref, path, api=True)
-        res = json.loads(urllib.request.urlopen(url).read())
+        res = read_github_api(url)
         if isinstance(res, list):
             type = 'dir'
             url = compose_github_repo_zip_url(owner, repo, ref)
@@ -1431,6 +3851,159 @@ def get_package_dir(model=None):
     return os.path.join(get_init_dir(), get_package_name() if model is None else model)
 
 
+def get_new_package_version_dir(model):
+    """Return a new dir, not yet existing, where a version of <model> is built to be installed.
+
+    See install_package_version.
+    """
+
+    _create_dir(
+        VERSIONS_DIR,
+        'Package versions dir creation failed: {}'.format(VERSIONS_DIR),
+        MLTmpDirCreateException(VERSIONS_DIR))
+
+    return os.path.join(VERSIONS_DIR, '{}-{}'.format(model, uuid.uuid4().hex))
+
+
+def install_package_version(model, version_dir):
+    """Install the version of <model> built in <version_dir>, replacing the one installed if any.
+
+    The package dir is a symbolic link to <version_dir>, swapped in by
+    renaming a new link over the old one, thus the package is always
+    either the old or the new version for the commands running at the
+    same time.  The old version is kept for the commands still running
+    in it, while the versions replaced before it are removed in the
+    background once replaced for VERSIONS_GRACE seconds.
+
+    A package installed without versions, as a plain directory, is first
+    moved aside, thus missing for a moment, and moved back if the swap
+    fails.  Either <version_dir> is installed or the installed package is
+    left as it was.
+    """
+
+    logger = logging.getLogger(__name__)
+
+    path = get_package_dir(model)
+    link = version_dir + '.link'
+    os.symlink(os.path.relpath(version_dir, os.path.dirname(path)), link)
+
+    # A package installed without versions is moved aside to be replaced by the link, which
+    # leaves it missing until replaced, thus is moved back if the link cannot replace it.
+
+    old = None
+    moved = False
+    try:
+        if os.path.islink(path):
+            old = os.path.realpath(path)
+        elif os.path.isdir(path):
+            old = get_new_package_version_dir(model)
+            os.rename(path, old)
+            moved = True
+        os.replace(link, path)
+    except BaseException:
+        if moved and not os.path.lexists(path):
+            os.rename(old, path)
+        if os.path.lexists(link):
+            os.remove(link)
+        raise
+
+    logger.debug("Installed {} as {}".format(version_dir, path))
+
+    # The new version is installed, thus failing to remove the older ones only leaves them to ml clean.
+
+    try:
+        if old is not None and old != os.path.realpath(version_dir):
+            os.utime(old)  # Replaced now.
+        for version in get_old_package_versions(model, keep=(old, os.path.realpath(version_dir))):
+            remove_dir_in_background(version)
+    except OSError:
+        logger.warning("Failed to remove the old versions of {}".format(model), exc_info=True)
+
+
+def get_old_package_versions(model, keep=(), age=VERSIONS_GRACE):
+    """Return the versions of <model> not installed and last changed more than <age> seconds ago.
+
+    The versions in <keep> are never returned.  The time a version was
+    replaced is recorded as its modification time.
+    """
+
+    pattern = re.compile(re.escape(model) + '-[0-9a-f]{32}$')
+    keep = {os.path.realpath(x) for x in keep if x is not None}
+    path = get_package_dir(model)
+    if os.path.islink(path):
+        keep.add(os.path.realpath(path))
+
+    versions = []
+    for name in os.listdir(VERSIONS_DIR) if os.path.exists(VERSIONS_DIR) else []:
+        version = os.path.join(VERSIONS_DIR, name)
+        if (pattern.match(name) and os.path.realpath(version) not in keep
+                and time.time() - os.lstat(version).st_mtime > age):
+            versions.append(version)
+
+    return versions
+
+
+def remove_dir_in_background(path):
+    """Remove the directory <path> by a detached process, without waiting for it."""
+
+    subprocess.Popen(
+        [sys.executable, '-c', 'import shutil, sys; shutil.rmtree(sys.argv[1], ignore_errors=True)', path],
+        stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        start_new_session=True)
+
+
+def remove_package_dir(model):
+    """Remove the installed package of <model>, both the link to its version and the version."""
+
+    path = get_package_dir(model)
+    if os.path.islink(path):
+        version_dir = os.path.realpath(path)
+        os.remove(path)
+        remove_file_or_dir(version_dir)
+    else:
+        remove_file_or_dir(path)
+
+
+def create_tmp_dir():
+    """Check if the scratch dir exists and if not then create it."""
+
+    return _create_dir(
+        TMP_DIR,
+        'Tmp dir creation failed: {}'.format(TMP_DIR),
+        MLTmpDirCreateException(TMP_DIR))
+
+
+def clean_tmp_dir(age=VERSIONS_GRACE):
+    """Remove what is left by interrupted installations older than <age> seconds.
+
+    These are the entries in the scratch dir and the package versions
+    which are not installed, including those replaced more than <age>
+    seconds ago.
+
+    Returns:
+        the number of entries removed.
+    """
+
+    installed = set()
+    init = get_init_dir()
+    for name in os.listdir(init) if os.path.exists(init) else []:
+        if os.path.islink(os.path.join(init, name)):
+            installed.add(os.path.realpath(os.path.join(init, name)))
+
+    removed = 0
+    for top in (TMP_DIR, VERSIONS_DIR):
+        for name in os.listdir(top) if os.path.exists(top) else []:
+            path = os.path.join(top, name)
+            if os.path.realpath(path) not in installed and time.time() - os.lstat(path).st_mtime > age:
+                if os.path.islink(path):
+                    os.remove(path)
+                else:
+                    remove_file_or_dir(path)
+                removed += 1
+
+    return removed
+
+
 def create_package_dir(model=None):
     """Check existence of dir where the model package is installed, if not create it and return."""
 
@@ -1499,90 +4072,304 @@ def get_package_config_file(model=None):
     return os.path.join(create_package_config_dir(model), CONFIG_FILE)
 
 
-def gen_packages_yaml(mlmodelsyaml='MLMODELS.yaml', packagesyaml='Packages.yaml'):
+def write_packages_yaml(docs, packagesyaml='Packages.yaml'):
+    """Write Packages.yaml from <docs>, an ordered dict of model name to its YAML document.
+
+    Each document is also written into index/<name>.yaml next to
+    Packages.yaml, and index/MANIFEST.yaml lists their sha256, so that
+    mlhub can download only the entries changed since its cached copy.
+    """
+
+    index_dir = os.path.join(os.path.dirname(packagesyaml), META_INDEX_DIR)
+    os.makedirs(index_dir, exist_ok=True)
+
+    manifest = collections.OrderedDict()
+    with open(packagesyaml, 'wb') as file:
+        for model, doc in docs.items():
+            if not doc.endswith('\n'):
+                doc += '\n'
+            doc = doc.encode()
+
+            # Write yaml entry separator and then the entry.
+
+            file.write("--- # {}\n".format(model).encode())
+            file.write(doc)
+
+            with open(os.path.join(index_dir, model + '.yaml'), 'wb') as entry_file:
+                entry_file.write(doc)
+
+            manifest[model] = hashlib.sha256(doc).hexdigest()
+
+    # Remove entries of models no longer listed.
+
+    for name in os.listdir(index_dir):
+        if name.endswith('.yaml') and name != META_MANIFEST and name[:-5] not in manifest:
+            os.remove(os.path.join(index_dir, name))
+
+    with open(os.path.join(index_dir, META_MANIFEST), 'w') as file:
+        yaml.dump(manifest, file, Dumper=OrderedYAMLDumper, default_flow_style=False)
+
+
+def _is_github_commit(ref):
+    """Check if the GitHub <ref> is a full commit SHA, which never changes."""
+
+    return re.fullmatch('[0-9a-f]{40}', ref) is not None
+
+
+def _fetch_pkgyaml(mlhubyaml, previous=None):
+    """Read <mlhubyaml> unless it is not modified since the <previous> read.
+
+    Returns:
+        the record of the read: location of MLHUB.yaml, its ETag and
+        Last-Modified, and its content; or <previous> if not modified.
+    """
+
+    headers = {}
+    if previous is not None:
+        if previous.get('etag') is not None:
+            headers['If-None-Match'] = previous['etag']
+        if previous.get('last_modified') is not None:
+            headers['If-Modified-Since'] = previous['last_modified']
+
+    try:
+        with open_url(mlhubyaml, headers) as response:
+            content = response.read()
+            etag = response.getheader('ETag')
+            last_modified = response.getheader('Last-Modified')
+    except urllib.error.HTTPError as error:
+        if error.code == 304 and previous is not None:
+            return previous
+        raise
+
+    if is_github_url(mlhubyaml) and mlhubyaml.startswith("https://api"):
+        content = base64.b64decode(json.loads(content)["content"])
+
+    return {'mlhubyaml': mlhubyaml,
+            'etag': etag,
+            'last_modified': last_modified,
+            'content': content.decode()}
+
+
+def _read_model_pkgyaml(model, location, retries, previous=None):
+    """Read the MLHUB.yaml of <model> at <location>, retrying on transient errors.
+
+    If the <previous> read of the same location is given, MLHUB.yaml is
+    only read again if it has been modified since, and not at all if
+    <location> refers to a commit.
+    """
+
+    if previous is not None and not is_url(location) and \
+            _is_github_commit(interpret_github_url(location)[2]):
+        return previous
+
+    for attempt in range(retries + 1):
+        try:
+            if previous is not None:
+                try:
+                    return _fetch_pkgyaml(previous['mlhubyaml'], previous)
+                except urllib.error.HTTPError as error:
+                    if error.code != 404:
+                        raise
+                    previous = None  # MLHUB.yaml was moved or renamed.
+
+            mlhubyaml = get_pkgyaml_github_url(location, resolve=False)  # Follow the ref to be told of changes.
+            print("Reading {}'s MLHUB.yaml file from {} ...".format(model, mlhubyaml))
+            return _fetch_pkgyaml(mlhubyaml)
+
+        except urllib.error.HTTPError as error:
+            if (error.code != 429 and error.code < 500) or attempt == retries:
+                raise
+        except (urllib.error.URLError, OSError, http.client.HTTPException):
+            if attempt == retries:
+                raise
+
+        time.sleep(2 ** attempt)
+
+
+def read_models_pkgyaml(models, checkpoint=None, state=None, workers=16, host_workers=8, retries=3):
+    """Read the MLHUB.yaml of the models concurrently.
+
+    Each model read is recorded into <checkpoint> so that an interrupted
+    run can be resumed without reading them again.  The records of a
+    previous run, <state>, are used to read only the MLHUB.yaml files
+    modified since.
+
+    Args:
+        models (dict): location of the models by name, as in MLMODELS.yaml.
+        checkpoint (str): file which records the models read, or None.
+        state (dict): records of the models read by a previous run, or None.
+        workers (int): number of models read at the same time.
+        host_workers (int): number of models read at the same time from the same host.
+        retries (int): number of retries of a model on transient errors.
+
+    Returns:
+        dict of the records by model name, except the failed ones.  A
+        record is a dict of the 'location' of the model, the 'mlhubyaml'
+        URL it was read from, its 'etag' and 'last_modified', and its
+        'content'.
+    """
+
+    logger = logging.getLogger(__name__)
+
+    # Resume from the checkpoint, skipping models whose location changed.
+
+    records = {}
+    if checkpoint is not None and os.path.exists(checkpoint):
+        with open(checkpoint) as file:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                except ValueError:  # Partially written when interrupted.
+                    continue
+                if models.get(record['model']) == record['location']:
+                    records[record.pop('model')] = record
+        print("Resuming from {} with {} models already read ...".format(checkpoint, len(records)))
+
+    if state is None:
+        state = {}
+
+    limiter = HostLimiter(host_workers)
+    lock = threading.Lock()
+
+    def _read(model, file):
+        location = models[model]
+        previous = state.get(model)
+        if previous is not None and previous['location'] != location:
+            previous = None
+
+        with limiter(location):
+            record = dict(_read_model_pkgyaml(model, location, retries, previous), location=location)
+
+        if file is not None:
+            with lock:
+                file.write(json.dumps(dict(record, model=model)) + '\n')
+                file.flush()
+
+        return record
+
+    file = None if checkpoint is None else open(checkpoint, 'a')
+    try:
+        with concurrent.futures.ThreadPoolExecutor(workers) as executor:
+            futures = {executor.submit(_read, model, file): model for model in models if model not in records}
+            for future in concurrent.futures.as_completed(futures):
+                model = futures[future]
+                try:
+                    records[model] = future.result()
+                except (urllib.error.URLError, OSError, http.client.HTTPException,
+                        DescriptionYAMLNotFoundException):
+                    logger.error("Failed to read MLHUB.yaml of {}".format(model), exc_info=True)
+    finally:
+        if file is not None:
+            file.close()
+
+    return records
+
+
+def _read_gen_state(packagesyaml):
+    """Return the records of the models read when <packagesyaml> was last generated."""
+
+    try:
+        with open(packagesyaml + '.state') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_gen_state(packagesyaml, records):
+    """Save the records of the models read to generate <packagesyaml>."""
+
+    path = packagesyaml + '.state'
+    with open(path + '.tmp', 'w') as file:
+        json.dump(records, file)
+    os.replace(path + '.tmp', path)
+
+
+def gen_packages_yaml(mlmodelsyaml='MLMODELS.yaml', packagesyaml='Packages.yaml', **kwargs):
     """Generate Packages.yaml, the curated list of model packages, by just concatenate all MLHUB.yaml.
     By default, it will generate Packages.yaml in current working dir.
 
     Args:
         mlmodelsyaml (str): YAML file which list all available models and their location.
         packagesyaml (str): YAML file which will hold meta data in all MLHUB.yaml.
+        kwargs: options of read_models_pkgyaml(), such as workers.
+
+    MLHUB.yaml files are read concurrently and recorded in <packagesyaml>.checkpoint,
+    so that an interrupted run resumes where it stopped.  The records are kept in
+    <packagesyaml>.state, so that the next run only reads MLHUB.yaml files which
+    have been modified since.
     """
 
-    entry = yaml.load(open(mlmodelsyaml), Loader=yaml.SafeLoader)
+    entry = yaml.load(open(mlmodelsyaml), Loader=YAMLLoader)
     model_list = list(entry.keys())
     model_list.sort()
     failed_models = []
 
-    with open(packagesyaml, 'w') as file:
-        for model in model_list:
-
-            # Write yaml entry separator
-
-            file.write("--- # {}\n".format(model))
-
-            # Read model's MLHUB.yaml file
+    # Read model's MLHUB.yaml file
 
-            try:
-                location = entry[model]
-                mlhubyaml = get_pkgyaml_github_url(location)
-                print("Reading {}'s MLHUB.yaml file from {} ...".format(model, mlhubyaml))
-                content = read_github_raw_file(mlhubyaml).decode()
-            except (urllib.error.HTTPError, DescriptionYAMLNotFoundException):
-                failed_models.append(model)
-                continue
+    checkpoint = packagesyaml + '.checkpoint'
+    records = read_models_pkgyaml(entry, checkpoint, _read_gen_state(packagesyaml), **kwargs)
 
-            for line in content.splitlines():
+    docs = collections.OrderedDict()
+    for model in model_list:
+        if model not in records:
+            failed_models.append(model)
+            continue
 
-                # Remove yaml entry separator in model's MLHUB.yaml to avoid duplication
+        # Remove yaml entry separator in model's MLHUB.yaml to avoid duplication
 
-                if line.startswith('---') or line.startswith('...'):
-                    continue
+        docs[model] = ''.join(line + '\n' for line in records[model]['content'].splitlines()
+                              if not line.startswith('---') and not line.startswith('...'))
 
-                file.write(line)
-                file.write('\n')
+    write_packages_yaml(docs, packagesyaml)
+    _write_gen_state(packagesyaml, records)
+    os.remove(checkpoint)
 
     if len(failed_models) != 0:
         print("Failed to curate list for models:\n    {}".format(', '.join(failed_models)))
 
 
-def gen_packages_yaml2(mlmodelsyaml='MLMODELS.yaml', packagesyaml='Packages.yaml'):
+def gen_packages_yaml2(mlmodelsyaml='MLMODELS.yaml', packagesyaml='Packages.yaml', **kwargs):
     """Generate Packages.yaml, the curated list of model packages, using yaml to ensure correct format.
     By default, it will generate Packages.yaml in current working dir.
 
     Args:
         mlmodelsyaml (str): YAML file which list all available models and their location.
         packagesyaml (str): YAML file which will hold meta data in all MLHUB.yaml.
+        kwargs: options of read_models_pkgyaml(), such as workers.
+
+    MLHUB.yaml files are read concurrently and recorded in <packagesyaml>.checkpoint,
+    so that an interrupted run resumes where it stopped.  The records are kept in
+    <packagesyaml>.state, so that the next run only reads MLHUB.yaml files which
+    have been modified since.
     """
 
-    meta = yaml.load(open(mlmodelsyaml), Loader=yaml.SafeLoader)
+    meta = yaml.load(open(mlmodelsyaml), Loader=YAMLLoader)
     model_list = list(meta.keys())
     model_list.sort()
     failed_models = []
 
-    with open(packagesyaml, "w") as file:
-        entry_list = []
-        for model in model_list:
+    # Read model's MLHUB.yaml file
 
-            # Read model's MLHUB.yaml file
+    checkpoint = packagesyaml + '.checkpoint'
+    records = read_models_pkgyaml(meta, checkpoint, _read_gen_state(packagesyaml), **kwargs)
 
-            try:
-                location = meta[model]
-                mlhubyaml = get_pkgyaml_github_url(location)
-                print("Reading {}'s MLHUB.yaml file from {} ...".format(model, mlhubyaml))
-                content = read_github_raw_file(mlhubyaml).decode()
-            except (urllib.error.HTTPError, DescriptionYAMLNotFoundException):
-                failed_models.append(model)
-                continue
+    docs = collections.OrderedDict()
+    for model in model_list:
+        if model not in records:
+            failed_models.append(model)
+            continue
 
-            try:
-                entry = yaml.load(content, Loader=yamlordereddictloader.Loader)
-            except (yaml.composer.ComposerError, yaml.scanner.ScannerError):
-                failed_models.append(model)
-                continue
+        try:
+            entry = yaml.load(records[model]['content'], Loader=OrderedYAMLLoader)
+        except (yaml.composer.ComposerError, yaml.scanner.ScannerError):
+            failed_models.append(model)
+            continue
 
-            entry_list.append(entry)
+        docs[model] = yaml.dump(entry, Dumper=OrderedYAMLDumper, default_flow_style=False)
 
-        yaml.dump_all(entry_list, file)
+    write_packages_yaml(docs, packagesyaml)
+    _write_gen_state(packagesyaml, records)
+    os.remove(checkpoint)
 
     if len(failed_models) != 0:
         print("Failed to curate list for models:\n    {}".format(', '.join(failed_models)))
@@ -1595,12 +4382,12 @@ def update_config(model, entry):
 
     if os.path.exists(config_file):
         with open(config_file, 'r') as file:
-            old_entry = yaml.load(file, Loader=yaml.SafeLoader)
+            old_entry = yaml.load(file, Loader=YAMLLoader)
             old_entry.update(entry)
             entry = old_entry
 
     with open(config_file, 'w') as file:
-        yaml.dump(entry, file, default_flow_style=False)
+        yaml.dump(entry, file, Dumper=YAMLDumper, default_flow_style=False)
 
 
 def update_conda_env_name(model, name):
@@ -1626,7 +4413,7 @@ def get_config(model, name):
     config_file = get_package_config_file(model)
     if os.path.exists(config_file):
         with open(config_file, 'r') as file:
-            entry = yaml.load(file, Loader=yaml.SafeLoader)
+            entry = yaml.load(file, Loader=YAMLLoader)
         if name in entry:
             return entry[name]
 
@@ -1999,6 +4786,10 @@ class ModelDownloadHaltException(Exception):
     pass
 
 
+class DownloadChecksumException(Exception):
+    pass
+
+
 class ModelNotInstalledException(Exception):
     pass
 
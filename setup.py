@@ -55,7 +55,6 @@ setup(
         'python-Levenshtein',
         'pyyaml',
         'requests',
-        'yamlordereddictloader',
     ],
     include_package_data=True,
 )
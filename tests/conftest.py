@@ -0,0 +1,10 @@
+"""Shared set up of the tests of mlhub."""
+
+import os
+import tempfile
+
+# Keep the log, caches and packages of the tests out of the user's ~/.mlhub.
+# This is set before mlhub is imported, as its constants are read from the
+# environment at import.
+
+os.environ['MLINIT'] = tempfile.mkdtemp(prefix='mlhub-tests-')
@@ -0,0 +1,229 @@
+"""Tests of resuming interrupted and segmented downloads."""
+
+import functools
+import hashlib
+import http.client
+import http.server
+import os
+import threading
+import time
+
+import pytest
+
+from mlhub import utils
+
+CONTENT = os.urandom(3 * 1024 * 1024 + 123)
+ETAG = '"{}"'.format(hashlib.sha256(CONTENT).hexdigest()[:16])
+
+
+class DroppingHandler(http.server.BaseHTTPRequestHandler):
+    """Serve CONTENT, dropping the connection after <drop_after> bytes of the first <drops> responses.
+
+    Range requests with an If-Range matching the ETag are answered with
+    the range asked for.  The headers of every request, and the most
+    responses sent at the same time, are recorded.  The body is sent in
+    chunks of 64 KiB, each after <delay> seconds.
+    """
+
+    protocol_version = 'HTTP/1.1'
+
+    def __init__(self, server_state, *args, **kwargs):
+        self.server_state = server_state
+        super().__init__(*args, **kwargs)
+
+    def do_GET(self):
+        state = self.server_state
+        with state['lock']:
+            state['requests'].append(dict(self.headers))
+            drop = state['drops'] > 0
+            state['drops'] -= 1
+            state['active'] += 1
+            state['max_active'] = max(state['max_active'], state['active'])
+
+        try:
+            self.send_body(drop)
+        except (BrokenPipeError, ConnectionResetError):  # The client stopped reading.
+            self.close_connection = True
+        finally:
+            with state['lock']:
+                state['active'] -= 1
+
+    def send_body(self, drop):
+        state = self.server_state
+
+        start, end = 0, len(CONTENT) - 1
+        range_ = self.headers.get('Range')
+        if range_ is not None and self.headers.get('If-Range') in (None, ETAG):
+            first, last = range_[len('bytes='):].split('-')
+            start, end = int(first), int(last) if last else end
+            self.send_response(206)
+            self.send_header('Content-Range', 'bytes {}-{}/{}'.format(start, end, len(CONTENT)))
+        else:
+            self.send_response(200)
+
+        self.send_header('Content-Length', str(end + 1 - start))
+        self.send_header('ETag', ETAG)
+        self.send_header('Accept-Ranges', 'bytes')
+        self.end_headers()
+
+        body = CONTENT[start:end + 1]
+        if drop:
+            body = body[:state['drop_after']]
+            self.close_connection = True
+
+        for i in range(0, len(body), 64 * 1024):
+            time.sleep(state['delay'])
+            self.wfile.write(body[i:i + 64 * 1024])
+        self.wfile.flush()
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    """Start a local HTTP server of CONTENT and return its state."""
+
+    state = {'lock': threading.Lock(), 'requests': [], 'drops': 0, 'drop_after': 1024 * 1024, 'delay': 0,
+             'active': 0, 'max_active': 0}
+    httpd = http.server.ThreadingHTTPServer(('127.0.0.1', 0), functools.partial(DroppingHandler, state))
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+
+    state['url'] = 'http://127.0.0.1:{}/file.bin'.format(httpd.server_address[1])
+    yield state
+
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    """Retry dropped downloads at once."""
+
+    monkeypatch.setattr(utils, 'time', FakeTime())
+
+
+class FakeTime(object):
+    """The time module as seen by mlhub, without sleeping."""
+
+    def __getattr__(self, name):
+        return getattr(time, name)
+
+    def sleep(self, seconds):
+        pass
+
+
+def test_download_resumes_dropped_connection(server, tmp_path):
+    server['drops'] = 1
+    path = str(tmp_path / 'file.bin')
+
+    sha256 = utils.download_file(server['url'], path, segments=1)
+
+    assert sha256 == hashlib.sha256(CONTENT).hexdigest()
+    with open(path, 'rb') as file:
+        assert file.read() == CONTENT
+    assert not os.path.exists(path + utils.EXT_PART)
+
+    assert len(server['requests']) == 2
+    assert 'Range' not in server['requests'][0]
+    assert server['requests'][1]['Range'] == 'bytes={}-'.format(server['drop_after'])
+    assert server['requests'][1]['If-Range'] == ETAG
+
+
+def test_download_resumes_part_file_of_previous_run(server, tmp_path):
+    server['drops'] = 1
+    path = str(tmp_path / 'file.bin')
+    part = path + utils.EXT_PART
+
+    # The first run gives up, leaving the .part file.
+
+    with pytest.raises((OSError, http.client.HTTPException)):
+        utils.download_file(server['url'], path, retries=0, segments=1)
+
+    assert not os.path.exists(path)
+    assert os.path.getsize(part) == server['drop_after']
+
+    # The next run asks only for the rest of the file.
+
+    expected = hashlib.sha256(CONTENT).hexdigest()
+    sha256 = utils.download_file(server['url'], path, segments=1, checksum={'sha256': expected})
+
+    assert sha256 == expected
+    with open(path, 'rb') as file:
+        assert hashlib.sha256(file.read()).hexdigest() == sha256
+    assert not os.path.exists(part)
+
+    assert len(server['requests']) == 2
+    assert server['requests'][1]['Range'] == 'bytes={}-'.format(server['drop_after'])
+
+
+@pytest.fixture
+def small_segments(monkeypatch):
+    """Split CONTENT into segments of 1 MiB, thus 3 of them."""
+
+    monkeypatch.setattr(utils, 'DOWNLOAD_SEGMENT_SIZE', 1024 * 1024)
+
+
+def get_ranges(server):
+    """Return the Range headers of the requests sent to <server>."""
+
+    return [x['Range'] for x in server['requests'] if 'Range' in x]
+
+
+def test_segmented_download(server, tmp_path, small_segments):
+    path = str(tmp_path / 'file.bin')
+
+    sha256 = utils.download_file(server['url'], path, segments=3)
+
+    assert sha256 == hashlib.sha256(CONTENT).hexdigest()
+    with open(path, 'rb') as file:
+        assert file.read() == CONTENT
+    assert not os.path.exists(path + utils.EXT_PART)
+    assert not os.path.exists(path + utils.EXT_PART + '.json')
+
+    # The first segment is read from the GET of the whole file.
+
+    size = len(CONTENT)
+    assert sorted(get_ranges(server)) == ['bytes={}-{}'.format(size // 3, size * 2 // 3 - 1),
+                                          'bytes={}-{}'.format(size * 2 // 3, size - 1)]
+
+
+def test_segmented_download_resumes_dropped_segment(server, tmp_path, small_segments):
+    server['drops'] = 1  # The GET of the whole file used for the first segment.
+    server['drop_after'] = 256 * 1024
+    path = str(tmp_path / 'file.bin')
+
+    sha256 = utils.download_file(server['url'], path, segments=3)
+
+    assert sha256 == hashlib.sha256(CONTENT).hexdigest()
+    with open(path, 'rb') as file:
+        assert file.read() == CONTENT
+    assert 'bytes={}-{}'.format(256 * 1024, len(CONTENT) // 3 - 1) in get_ranges(server)
+
+
+def test_segmented_download_checksum_mismatch(server, tmp_path, small_segments):
+    path = str(tmp_path / 'file.bin')
+    checksum = {'sha256': hashlib.sha256(b'other').hexdigest()}
+
+    with pytest.raises(utils.DownloadChecksumException):
+        utils.download_file(server['url'], path, segments=3, checksum=checksum)
+
+    assert len(get_ranges(server)) == 2  # Segmented.
+    assert not os.path.exists(path)
+    assert not os.path.exists(path + utils.EXT_PART)
+    assert not os.path.exists(path + utils.EXT_PART + '.json')
+
+
+def test_segments_of_file_dep_are_limited_per_host(server, tmp_path, small_segments):
+    server['delay'] = 0.005  # Keep the responses going long enough to overlap.
+
+    limiter = utils.HostLimiter(2)
+    dep = utils._download_file_dep(server['url'], None, str(tmp_path / 'cache'), str(tmp_path / 'archive'),
+                                   limiter, {}, 3)
+
+    with open(dep['archive'], 'rb') as file:
+        assert file.read() == CONTENT
+    assert len(get_ranges(server)) == 1  # Two segments, as only two requests to the host are allowed.
+    assert server['max_active'] <= 2
+    assert limiter.acquire_free(server['url'], 3) == 2  # All given back.
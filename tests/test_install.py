@@ -0,0 +1,58 @@
+"""Tests of installing package versions."""
+
+import os
+import time
+
+from mlhub import utils
+
+
+def build_version(model, content):
+    """Return a new version dir of <model> with a file of <content>."""
+
+    version_dir = utils.get_new_package_version_dir(model)
+    os.makedirs(version_dir)
+    with open(os.path.join(version_dir, 'demo.py'), 'w') as file:
+        file.write(content)
+    return version_dir
+
+
+def test_replaced_version_is_kept_for_running_commands(monkeypatch):
+    removed = []
+    monkeypatch.setattr(utils, 'remove_dir_in_background', removed.append)
+
+    first = build_version('keep', 'first')
+    utils.install_package_version('keep', first)
+    cwd = os.path.realpath(utils.get_package_dir('keep'))  # As a command running in the package.
+
+    second = build_version('keep', 'second')
+    utils.install_package_version('keep', second)
+
+    with open(os.path.join(utils.get_package_dir('keep'), 'demo.py')) as file:
+        assert file.read() == 'second'
+    with open(os.path.join(cwd, 'demo.py')) as file:
+        assert file.read() == 'first'
+    assert removed == []
+
+
+def test_versions_replaced_before_the_last_are_removed_after_grace(monkeypatch):
+    removed = []
+    monkeypatch.setattr(utils, 'remove_dir_in_background', removed.append)
+
+    versions = [build_version('old', str(i)) for i in range(3)]
+    utils.install_package_version('old', versions[0])
+    utils.install_package_version('old', versions[1])
+
+    # Replaced too recently to be removed.
+
+    utils.install_package_version('old', versions[2])
+    assert removed == []
+
+    past = time.time() - utils.VERSIONS_GRACE - 60
+    for version in versions[:2]:
+        os.utime(version, (past, past))
+
+    fourth = build_version('old', '3')
+    utils.install_package_version('old', fourth)
+
+    assert sorted(removed) == sorted(versions[:2])  # The version replaced just now is kept.
+    assert os.path.realpath(utils.get_package_dir('old')) == os.path.realpath(fourth)
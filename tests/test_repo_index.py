@@ -0,0 +1,190 @@
+"""Tests of the compiled repo index."""
+
+import functools
+import gc
+import hashlib
+import http.server
+import json
+import os
+import threading
+import time
+
+import pytest
+import yaml
+
+from mlhub import utils
+
+MODELS = 2000
+
+
+def write_cached_index(cache_dir, models=MODELS, version='1.0'):
+    """Write a Packages.yaml of <models> into <cache_dir> with its state, as cached from a repo."""
+
+    content = ''.join(
+        '--- # m{0}\n'
+        'meta:\n'
+        '  name: m{0}\n'
+        '  title: Model {0} for testing\n'
+        '  version: "{1}"\n'
+        '  url: https://example.com/m{0}.zip\n'
+        '  keywords: [test, model]\n'
+        'commands:\n'
+        '  demo:\n'
+        '    description: Run a demo\n'
+        '  display: Display the model\n'.format(i, version) for i in range(models)).encode()
+
+    os.makedirs(cache_dir, exist_ok=True)
+    with open(os.path.join(cache_dir, utils.META_YAML), 'wb') as file:
+        file.write(content)
+    with open(os.path.join(cache_dir, utils.REPO_CACHE_STATE), 'w') as file:
+        json.dump({'url': 'https://example.com/' + utils.META_YAML, 'etag': None, 'last_modified': None,
+                   'revision': hashlib.sha256(content).hexdigest(), 'fetched': time.time()}, file)
+
+
+def best_time(func, repeat=3):
+    """Return the result of <func> and the best time of <repeat> calls, timed without garbage collection as timeit."""
+
+    times = []
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = func()
+            times.append(time.perf_counter() - start)
+    finally:
+        if enabled:
+            gc.enable()
+
+    return result, min(times)
+
+
+def test_compiled_index_matches_packages_yaml(tmp_path):
+    cache_dir = str(tmp_path)
+    write_cached_index(cache_dir)
+
+    index = utils._load_repo_index(cache_dir)
+
+    assert len(index['entries']) == MODELS
+    assert index['lookup']['m42'] == 42
+    meta = index['entries'][42]['meta']
+    assert meta['name'] == 'm42'
+    assert meta['version'] == '1.0'
+    assert meta['url'] == 'https://example.com/m42.zip'
+    assert meta['commands'] == ['demo', 'display']
+    assert os.path.exists(os.path.join(cache_dir, utils.REPO_CACHE_INDEX))
+
+    # The saved index is loaded as compiled.
+
+    assert utils._load_repo_index(cache_dir) == index
+
+
+def test_compiled_index_is_rebuilt_when_the_index_changes(tmp_path):
+    cache_dir = str(tmp_path)
+    write_cached_index(cache_dir)
+    utils._load_repo_index(cache_dir)
+
+    write_cached_index(cache_dir, models=10, version='2.0')
+    index = utils._load_repo_index(cache_dir)
+
+    assert len(index['entries']) == 10
+    assert index['entries'][0]['meta']['version'] == '2.0'
+
+
+def test_loading_compiled_index_is_faster_than_parsing(tmp_path):
+    cache_dir = str(tmp_path)
+    write_cached_index(cache_dir)
+    utils._load_repo_index(cache_dir)
+
+    def parse_yaml():
+        with open(os.path.join(cache_dir, utils.META_YAML), 'rb') as file:
+            return list(yaml.load_all(file, Loader=utils.YAMLLoader))
+
+    parsed, parse = best_time(parse_yaml)
+    index, load = best_time(lambda: utils._load_repo_index(cache_dir))
+
+    assert len(index['entries']) == len(parsed)
+
+    # Even with libyaml, parsing is well over ten times slower than loading.
+
+    assert load * 10 < parse, "load {:.4f}s, parse {:.4f}s".format(load, parse)
+
+
+def test_compiled_index_without_state(tmp_path):
+    cache_dir = str(tmp_path)
+    write_cached_index(cache_dir, models=10)
+    os.remove(os.path.join(cache_dir, utils.REPO_CACHE_STATE))
+
+    index = utils._load_repo_index(cache_dir)
+
+    assert len(index['entries']) == 10
+    assert index['revision'] == utils.get_file_sha256(os.path.join(cache_dir, utils.META_YAML))
+
+
+@pytest.fixture
+def hub(tmp_path):
+    """Serve a repo from a local dir, recording the paths requested."""
+
+    root = tmp_path / 'hub'
+    (root / utils.META_INDEX_DIR).mkdir(parents=True)
+    paths = []
+
+    class Handler(http.server.SimpleHTTPRequestHandler):
+        def do_GET(self):
+            paths.append(self.path)
+            super().do_GET()
+
+        def log_message(self, format, *args):
+            pass
+
+    httpd = http.server.ThreadingHTTPServer(('127.0.0.1', 0), functools.partial(Handler, directory=str(root)))
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+
+    yield {'root': root, 'paths': paths, 'repo': 'http://127.0.0.1:{}/'.format(httpd.server_address[1])}
+
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def write_hub(root, docs):
+    """Write the Packages.yaml, entries and manifest of <docs>, a dict of name to entry, into <root>."""
+
+    with open(os.path.join(str(root), utils.META_YAML), 'wb') as file:
+        file.write(b''.join(b'--- # ' + name.encode() + b'\n' + doc for name, doc in docs.items()))
+
+    index = os.path.join(str(root), utils.META_INDEX_DIR)
+    with open(os.path.join(index, utils.META_MANIFEST), 'w') as manifest:
+        for name, doc in docs.items():
+            with open(os.path.join(index, name + '.yaml'), 'wb') as file:
+                file.write(doc)
+            manifest.write('{}: {}\n'.format(name, hashlib.sha256(doc).hexdigest()))
+
+
+def test_sync_patches_changed_entries_with_any_names(hub):
+    names = ['yes', '1', 'm 1']
+    docs = {x: 'meta:\n  name: "{}"\n  version: "1.0"\n'.format(x).encode() for x in names}
+    write_hub(hub['root'], docs)
+
+    utils.fetch_repo_index(hub['repo'])
+    cache_dir = utils.get_repo_cache_dir(hub['repo'])
+
+    # The manifest matching the cached index is kept.
+
+    synced, manifest = utils.sync_repo_index(hub['repo'], cache_dir, utils._read_repo_cache_state(cache_dir))
+    assert synced
+    assert list(manifest['entries']) == names
+
+    # Only the changed entry is downloaded and patched into the cached index.
+
+    docs['m 1'] = docs['m 1'].replace(b'1.0', b'2.0')
+    write_hub(hub['root'], docs)
+    manifest_file = str(hub['root'] / utils.META_INDEX_DIR / utils.META_MANIFEST)
+    os.utime(manifest_file, (time.time() + 10, time.time() + 10))  # Modified after cached, to the second.
+    del hub['paths'][:]
+
+    synced, manifest = utils.sync_repo_index(hub['repo'], cache_dir, utils._read_repo_cache_state(cache_dir))
+
+    assert synced
+    assert hub['paths'] == ['/index/MANIFEST.yaml', '/index/m%201.yaml']
+    with open(os.path.join(cache_dir, utils.META_YAML), 'rb') as file:
+        assert file.read() == (hub['root'] / utils.META_YAML).read_bytes()
@@ -0,0 +1,69 @@
+"""Tests of ml search over the inverted index of the repo index."""
+
+import argparse
+
+from mlhub import commands
+from mlhub import utils
+
+ENTRIES = [
+    {'meta': {'name': 'forecast', 'title': 'Weather forecast', 'description': 'Predict the rain of tomorrow.'}},
+    {'meta': {'name': 'rain', 'title': 'Will it rain', 'description': 'Predict rain tomorrow.'}},
+    {'meta': {'name': 'clouds', 'title': 'Rain clouds', 'description': 'Spot clouds.'}},
+    {'meta': {'name': 'umbrella', 'title': 'Umbrella', 'keywords': ['rain', 'weather']}},
+    {'meta': {'name': 'storm', 'title': 'Storms'}, 'commands': {'rain': 'Rain radar', 'wind': 'Wind map'}},
+    {'meta': {'name': 'drizzle', 'title': 'Drizzle', 'description': 'Light rain.'}},
+    {'meta': {'name': 'sunny', 'title': 'Sunshine', 'description': 'Sunny days.'}},
+]
+
+
+def rank(terms):
+    """Return the names and scores of the models of ENTRIES matching <terms>, the best first."""
+
+    index = utils.compile_repo_index(ENTRIES, 'test')
+    search_index = utils.compile_repo_search_index(index)
+    ranked = utils.rank_repo_search(search_index, terms)
+    return [(index['entries'][pos]['meta']['name'], score) for score, pos in ranked]
+
+
+def search(terms):
+    """Return the names of the models of ENTRIES matching <terms>, the best first."""
+
+    return [name for name, score in rank(terms)]
+
+
+def test_ranked_by_field_weights():
+
+    # name (8) + title (4) > title (4) = keywords (4) > commands (2) > description (1), ties in index order.
+
+    assert search(['rain']) == ['rain', 'clouds', 'umbrella', 'storm', 'forecast', 'drizzle']
+
+
+def test_whole_word_ranks_above_prefix():
+    assert search(['sun']) == ['sunny']
+    assert rank(['sunny'])[0][1] > rank(['sun'])[0][1]
+
+
+def test_all_terms_must_match():
+    assert search(['rain', 'weather']) == ['umbrella', 'forecast']
+    scores = dict(rank(['rain', 'weather']))
+    assert scores['umbrella'] == dict(rank(['rain']))['umbrella'] + dict(rank(['weather']))['umbrella']
+    assert search(['Predict', 'TOMORROW']) == ['forecast', 'rain']
+
+
+def test_no_match():
+    assert search(['snow']) == []
+    assert search(['rain', 'snow']) == []
+
+
+def test_search_command(tmp_path, capsys):
+    packages = tmp_path / 'Packages.yaml'
+    packages.write_text(''.join(
+        '--- # {0}\nmeta:\n  name: {0}\n  title: {1}\n  version: "1.0"\n  url: https://example.com/{0}.zip\n'.format(
+            entry['meta']['name'], entry['meta']['title']) for entry in ENTRIES))
+    repo = 'file://{}/'.format(tmp_path)
+
+    commands.search_available(argparse.Namespace(mlhub=repo, term=['rain'], name_only=True, quiet=False))
+    assert capsys.readouterr().out.split() == ['rain', 'clouds']
+
+    commands.search_available(argparse.Namespace(mlhub=repo, term=['snow'], name_only=False, quiet=False))
+    assert "provides no models matching 'snow'" in capsys.readouterr().out
@@ -0,0 +1,124 @@
+"""Tests of the download store shared by the packages."""
+
+import functools
+import hashlib
+import http.server
+import os
+import threading
+import time
+
+import pytest
+
+from mlhub import utils
+
+
+@pytest.fixture
+def files(tmp_path):
+    """Serve the files of a local dir, recording the status of the responses."""
+
+    root = tmp_path / 'files'
+    root.mkdir()
+    statuses = []
+
+    class Handler(http.server.SimpleHTTPRequestHandler):
+        def send_response(self, code, message=None):
+            statuses.append(code)
+            super().send_response(code, message)
+
+        def log_message(self, format, *args):
+            pass
+
+    httpd = http.server.ThreadingHTTPServer(('127.0.0.1', 0), functools.partial(Handler, directory=str(root)))
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+
+    yield {'root': root, 'statuses': statuses, 'url': 'http://127.0.0.1:{}/'.format(httpd.server_address[1])}
+
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def write_file(path, content, age=0):
+    """Write <content> into <path>, modified <age> seconds ago."""
+
+    path.write_bytes(content)
+    os.utime(str(path), (time.time() - age, time.time() - age))
+
+
+def download_dep(url, tmp_path):
+    """Download the file dependency at <url> as ml configure does."""
+
+    return utils._download_file_dep(url, None, str(tmp_path / 'cache'), str(tmp_path / 'archive'),
+                                    utils.HostLimiter(4), {}, 1)
+
+
+def test_changed_file_replaces_cached_copy(files, tmp_path):
+    url = files['url'] + 'data.csv'
+    write_file(files['root'] / 'data.csv', b'old\n', age=60)
+
+    dep = download_dep(url, tmp_path)
+    assert not dep['reuse']
+
+    # Not modified, thus the cached copy is used after a 304.
+
+    dep = download_dep(url, tmp_path)
+    assert dep['reuse']
+    assert files['statuses'][-1] == 304
+
+    # Modified, thus the cached copy is replaced by the file returned.
+
+    write_file(files['root'] / 'data.csv', b'new\n')
+    del files['statuses'][:]
+
+    dep = download_dep(url, tmp_path)
+
+    assert not dep['reuse']
+    assert files['statuses'] == [200]
+    with open(dep['archive'], 'rb') as file:
+        assert file.read() == b'new\n'
+
+
+def test_installed_file_is_writable(files, tmp_path):
+    content = b'data\n'
+    write_file(files['root'] / 'data.csv', content, age=60)
+
+    dep = download_dep(files['url'] + 'data.csv', tmp_path)
+
+    with open(dep['archive'], 'ab') as file:  # As a package script appending to its data.
+        file.write(b'more\n')
+
+    blob = utils.get_store_blob(hashlib.sha256(content).hexdigest())
+    with open(blob, 'rb') as file:
+        assert file.read() == content
+    assert utils.has_store_blob(hashlib.sha256(content).hexdigest())
+
+
+def test_store_blob_linked_read_only(tmp_path):
+    path = tmp_path / 'file'
+    path.write_bytes(b'shared\n')
+    sha256 = hashlib.sha256(b'shared\n').hexdigest()
+    blob = utils.get_store_blob(sha256)
+    os.makedirs(os.path.dirname(blob), exist_ok=True)
+    os.replace(str(path), blob)
+    utils._seal_store_blob(blob)
+
+    link = str(tmp_path / 'link')
+    utils.link_store_blob(sha256, link)
+
+    with open(link, 'rb') as file:
+        assert file.read() == b'shared\n'
+
+    # Linked to the read-only blob, unless a reflink which is a copy of its own.
+
+    if os.path.samefile(link, blob):
+        assert os.stat(link).st_mode & 0o777 == 0o444
+    else:
+        assert os.stat(link).st_mode & 0o777 == 0o644
+
+
+def test_remove_dangling_symlink(tmp_path):
+    link = str(tmp_path / 'link')
+    os.symlink(str(tmp_path / 'missing'), link)
+
+    utils.remove_file_or_dir(link)
+
+    assert not os.path.lexists(link)
@@ -0,0 +1,68 @@
+"""Tests of the YAML loaders, and benchmark of libyaml against pure Python."""
+
+import time
+
+import pytest
+import yaml
+
+from mlhub import utils
+
+MODELS = 1000
+
+
+def make_packages_yaml(models=MODELS):
+    """Return a synthetic Packages.yaml of <models>, as bytes."""
+
+    return ''.join(
+        '--- # m{0}\n'
+        'meta:\n'
+        '  name: m{0}\n'
+        '  title: Model {0} for testing\n'
+        '  version: "1.0"\n'
+        '  description: >-\n'
+        '    A model to check the speed of loading a large index of\n'
+        '    model packages.\n'
+        '  url: https://example.com/m{0}.zip\n'
+        '  keywords: [test, model, benchmark]\n'
+        'commands:\n'
+        '  demo:\n'
+        '    description: Run a demo\n'
+        '  display: Display the model\n'
+        '  score: Score new data\n'.format(i) for i in range(models)).encode()
+
+
+def best_time(func, repeat=3):
+    """Return the result of <func> and the best time of <repeat> calls."""
+
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - start)
+
+    return result, min(times)
+
+
+def test_ordered_loader_keeps_command_order():
+    content = 'commands:\n  zeta: z\n  alpha: a\n  mid: m\n'
+
+    loaded = yaml.load(content, Loader=utils.OrderedYAMLLoader)
+
+    assert list(loaded['commands']) == ['zeta', 'alpha', 'mid']
+    assert yaml.dump(loaded, Dumper=utils.OrderedYAMLDumper, default_flow_style=False) == content
+
+
+@pytest.mark.skipif(not yaml.__with_libyaml__, reason="PyYAML is not built with libyaml")
+def test_libyaml_loader_is_faster_than_pure_python():
+    content = make_packages_yaml()
+
+    fast, fast_time = best_time(lambda: list(yaml.load_all(content, Loader=yaml.CSafeLoader)))
+    slow, slow_time = best_time(lambda: list(yaml.load_all(content, Loader=yaml.SafeLoader)), repeat=1)
+
+    assert utils.YAMLLoader is yaml.CSafeLoader
+    assert len(fast) == MODELS
+    assert fast == slow
+
+    # libyaml is usually around ten times faster.
+
+    assert fast_time * 3 < slow_time, "CSafeLoader {:.3f}s, SafeLoader {:.3f}s".format(fast_time, slow_time)